@@ -0,0 +1,146 @@
+"""
+compares axaprocessor.simple_json_parsr (streaming parser) with the previous implementation
+which loaded the whole simple-json and cleaned tables with pandas. Checks that both give the
+same pages (previous implementation drops the last page) and reports time and peak memory.
+
+Usage
+-------------
+    python benchmarks/simple_json_benchmark.py ../output/file1/file1.simple.json ...
+    python benchmarks/simple_json_benchmark.py --pages 1000
+
+without files a synthetic simple-json with 'pages' pages is generated. axaserver modules
+import nlputils relatively, so the folder containing the repo is added to sys.path
+"""
+import argparse
+import importlib
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+import pandas as pd
+
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO.parent))
+axaprocessor = importlib.import_module(f"{REPO.name}.src.nlputils.components.axaserver.axaprocessor")
+
+
+def legacy_simple_json_parsr(filepath):
+    """ simple_json_parsr before streaming parser, kept for comparison"""
+    with open(filepath) as file:
+        simple_json = json.load(file)
+
+    pages = []
+    type_list = set()
+    page = {}
+    for i in simple_json:
+        if page and page['page'] == i['page']+1:
+            type_list.add(i['type'])
+            del i['page']
+            page['content'].append(i)
+        else:
+            if page:
+                pages.append(page)
+            page = {'page':i['page']+1,'content':[]}
+            type_list.add(i['type'])
+            del i['page']
+            page['content'].append(i)
+    page_wise_doc = {'page_list':pages,'unique_elements_type':type_list}
+
+    def check_column_header(string_list):
+        match = [bool(re.search(r'\*\*(.*?)\*\*', str(text))) for text in string_list]
+        return sum(match)/len(match)>0.6, [re.sub(r'\*\*', '', str(text)) for text in string_list]
+
+    page_cache = 0
+    table_cache = []
+    for page in pages:
+        for element in page['content']:
+            if element['type'] == 'table':
+                if_col_header, col_header = check_column_header(element['content'][0])
+                if if_col_header:
+                    element['columns'] = col_header
+                    element['content'].pop(0)
+                    table_cache = col_header
+                    page_cache = page['page']
+                elif (page['page'] == page_cache +1) & (len(table_cache)==len(col_header)):
+                    element['columns'] = table_cache
+                    page_cache = page['page']
+                else:
+                    element['columns'] = [f'column_{i}' for i in range(len(col_header))]
+                    table_cache = col_header
+                    page_cache = page['page']
+    for page in pages:
+        for element in page['content']:
+            if element['type'] == 'table':
+                tmp = pd.DataFrame(data = element['content'],columns=element['columns'])
+                tmp.dropna(axis=0, how='all',inplace=True)
+                tmp.dropna(axis=1, how='all',inplace=True)
+                element['columns'] = list(tmp.columns)
+                element['content'] = tmp.values.tolist()
+    return page_wise_doc
+
+
+def synthetic_simple_json(file_path, pages, seed=0):
+    """ writes simple-json with paragraphs, headings and tables (some continued on next page)"""
+    rng = random.Random(seed)
+    elements = []
+    for page in range(pages):
+        for _ in range(rng.randint(5, 15)):
+            element_type = rng.choice(['paragraph', 'paragraph', 'paragraph', 'heading', 'table'])
+            if element_type == 'table':
+                width = rng.randint(2, 6)
+                header = [f"**col {j}**" if rng.random() < 0.6 else f"value {j}" for j in range(width)]
+                rows = [[rng.choice([None, f"cell {r}.{j}"]) for j in range(width)]
+                        for r in range(rng.randint(1, 20))]
+                elements.append({'type':'table', 'content':[header] + rows, 'page':page})
+            elif element_type == 'heading':
+                elements.append({'type':'heading', 'content':f"Heading {page}", 'level':1, 'page':page})
+            else:
+                elements.append({'type':'paragraph', 'page':page,
+                                 'content':" ".join(rng.choice(['lorem', 'ipsum', 'dolor', 'sit'])
+                                                    for _ in range(rng.randint(10, 200)))})
+    with open(file_path, 'w') as file:
+        json.dump(elements, file)
+
+
+def measure(function, filepath):
+    """ returns time, peak memory (MB, separate run) and output of function"""
+    start = time.perf_counter()
+    output = function(filepath)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    function(filepath)
+    peak = tracemalloc.get_traced_memory()[1]/1e6
+    tracemalloc.stop()
+    return elapsed, peak, output
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--pages", type=int, default=1000)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.TemporaryDirectory()
+    files = args.files
+    if not files:
+        files = [os.path.join(tmp_dir.name, "synthetic.json")]
+        synthetic_simple_json(files[0], args.pages)
+
+    for filepath in files:
+        legacy_time, legacy_peak, legacy = measure(legacy_simple_json_parsr, filepath)
+        new_time, new_peak, new = measure(axaprocessor.simple_json_parsr, filepath)
+        same = (new['page_list'][:len(legacy['page_list'])] == legacy['page_list'] and
+                new['unique_elements_type'] == legacy['unique_elements_type'])
+        print(f"{filepath}: {os.path.getsize(filepath)/1e6:.1f}MB, pages: {len(new['page_list'])}")
+        print(f"   legacy: {legacy_time:.3f}s {legacy_peak:.1f}MB peak, "
+              f"streaming: {new_time:.3f}s {new_peak:.1f}MB peak, speedup: {legacy_time/new_time:.1f}x")
+        print(f"   same pages: {same}, pages recovered: {len(new['page_list']) - len(legacy['page_list'])}")
+        # pages consumed one at a time, ex: written to disk
+        iter_time, iter_peak, _ = measure(lambda f: sum(1 for _ in axaprocessor.iter_simple_json_pages(f)),
+                                          filepath)
+        print(f"   iter_simple_json_pages: {iter_time:.3f}s {iter_peak:.1f}MB peak")
@@ -0,0 +1,65 @@
+"""
+compares nlputils.splitter.TextSplitter with the langchain splitters, checks that both give
+the same chunks and reports the time taken. langchain is needed only for this benchmark
+(pip install langchain==0.2.6 langchain-text-splitters==0.2.4)
+
+Usage
+-------------
+    python benchmarks/splitter_benchmark.py ../output/tmp/ --file_extension md --chunk_size 800 --overlap 10
+
+the folder is searched recursively for page-wise files, ex: the output of create_markdown
+or useOCR_create_text for the corpus
+"""
+import argparse
+import time
+from nlputils.utils import get_files
+from nlputils.splitter import TextSplitter, MARKDOWN_SEPARATORS, TEXT_SEPARATORS
+from langchain.text_splitter import MarkdownTextSplitter
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+
+def run(splitter, texts, repeat):
+    """ returns the best time of 'repeat' runs and the chunks"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = [splitter.split_text(text) for text in texts]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, chunks
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("folder")
+    parser.add_argument("--file_extension", default="md", choices=["md", "txt"])
+    parser.add_argument("--chunk_size", type=int, default=800)
+    parser.add_argument("--overlap", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    files = get_files(args.folder, file_extensions=[args.file_extension])[args.file_extension]
+    texts = []
+    for page in files:
+        with open(page, 'r') as f:
+            texts.append(f.read())
+    print(f"{len(texts)} pages, {sum(len(t) for t in texts)/1e6:.1f}M characters")
+
+    if args.file_extension == 'md':
+        langchain_splitter = MarkdownTextSplitter(chunk_size=args.chunk_size, chunk_overlap=args.overlap)
+        native_splitter = TextSplitter(args.chunk_size, args.overlap, MARKDOWN_SEPARATORS)
+    else:
+        langchain_splitter = RecursiveCharacterTextSplitter(chunk_size=args.chunk_size,
+                                    chunk_overlap=args.overlap, length_function=len,
+                                    is_separator_regex=False)
+        native_splitter = TextSplitter(args.chunk_size, args.overlap, TEXT_SEPARATORS)
+
+    langchain_time, langchain_chunks = run(langchain_splitter, texts, args.repeat)
+    native_time, native_chunks = run(native_splitter, texts, args.repeat)
+
+    mismatch = [files[i] for i in range(len(texts)) if langchain_chunks[i] != native_chunks[i]]
+    print(f"langchain: {langchain_time:.3f}s, native: {native_time:.3f}s, "
+          f"speedup: {langchain_time/native_time:.1f}x")
+    print(f"chunks: {sum(len(c) for c in native_chunks)}, pages with different chunks: {len(mismatch)}")
+    for page in mismatch[:10]:
+        print("  ", page)
@@ -6,9 +6,9 @@ install_requires = [
         "pymupdf4llm == 0.0.17",
         "docx2pdf == 0.1.8",
         "docker == 7.1.0",
+        "aiohttp == 3.10.10",
+        "pyarrow == 17.0.0",
         "gliner == 0.2.13",
-        "langchain == 0.2.6",
-        "langchain-text-splitters == 0.2.4",
 ]
 
 
@@ -0,0 +1,157 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from .utils import file_sha256
+
+
+class ResultCache:
+    """
+    content addressed cache for the outputs of document processors. The key is built from
+    sha256 of the file plus the processor name and its config, so the cache survives the
+    renaming/re-ordering of files and is invalidated when the config changes.
+
+    Usage
+    -------------
+        cache = ResultCache(cache_dir="../cache/", max_size_gb=20)
+        key = cache.make_key(file_path, processor='docling', config=pipeline_options)
+        path = cache.get(key, restore_to="../output/filename/")
+        if path is None:
+            ... process the file and save the output to "../output/filename/"
+            cache.put(key, "../output/filename/")
+
+    """
+
+    def __init__(self, cache_dir:str, max_size_gb:float=10):
+        """
+        Params
+        -------------
+        - cache_dir: folder where the cached outputs and manifest are saved
+        - max_size_gb: size limit of the cache, least recently used entries are evicted
+                    once the limit is crossed
+        """
+        self.cache_dir = cache_dir
+        self.max_size = int(max_size_gb * 1024**3)
+        self.manifest_path = os.path.join(cache_dir, "manifest.json")
+        # put can be called from many threads (ex: asyncio.to_thread), manifest is guarded
+        self._lock = threading.RLock()
+        os.makedirs(cache_dir, exist_ok=True)
+        # manifest: key -> {'path', 'size', 'last_access'}, keeps the lookups O(1)
+        self.manifest = {}
+        if os.path.isfile(self.manifest_path):
+            try:
+                with open(self.manifest_path) as file:
+                    self.manifest = json.load(file)
+            except Exception as e:
+                logging.warning(f"cache manifest corrupt, starting empty cache: {e}")
+
+
+    @staticmethod
+    def make_key(file_path:str, processor:str, config=None)->str:
+        """
+        returns the cache key for file processed by processor with config
+
+        Params
+        -------------
+        - file_path: path of the input file
+        - processor: name of the processor ex: 'axaparsr', 'docling', 'pymupdf4llm'
+        - config: config used by processor, can be filepath (ex: axaparsr config json),
+                dict, pydantic model (ex: docling PdfPipelineOptions) or any object with
+                stable str representation
+        """
+        if config is None:
+            config_str = ""
+        elif isinstance(config, str) and os.path.isfile(config):
+            with open(config, 'rb') as file:
+                config_str = hashlib.sha256(file.read()).hexdigest()
+        elif isinstance(config, dict):
+            config_str = json.dumps(config, sort_keys=True, default=str)
+        elif hasattr(config, 'model_dump_json'):
+            config_str = config.model_dump_json()
+        else:
+            config_str = str(config)
+        key = hashlib.sha256()
+        for part in [file_sha256(file_path), processor, config_str]:
+            key.update(part.encode('utf-8'))
+            key.update(b'\0')
+        return key.hexdigest()
+
+
+    def get(self, key:str, restore_to:str=None)->str | None:
+        """
+        returns the cached output for key, or None if not in cache. If restore_to is given
+        the cached output is copied to that location and restore_to is returned, else the
+        location of output within cache is returned.
+        """
+        with self._lock:
+            entry = self.manifest.get(key)
+            if entry is None:
+                return None
+            cached_path = os.path.join(self.cache_dir, entry['path'])
+            if not os.path.exists(cached_path):
+                del self.manifest[key]
+                return None
+            entry['last_access'] = time.time()
+        if restore_to is None:
+            return cached_path
+        if os.path.isdir(cached_path):
+            shutil.copytree(cached_path, restore_to, dirs_exist_ok=True)
+        else:
+            os.makedirs(os.path.dirname(restore_to) or ".", exist_ok=True)
+            shutil.copy2(cached_path, restore_to)
+        return restore_to
+
+
+    def put(self, key:str, output_path:str)->str:
+        """
+        copies the output (file or folder) to cache under key and returns the location
+        of output within cache
+        """
+        rel_path = os.path.join(key[:2], key)
+        cached_path = os.path.join(self.cache_dir, rel_path)
+        if os.path.exists(cached_path):
+            shutil.rmtree(cached_path) if os.path.isdir(cached_path) else os.remove(cached_path)
+        os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+        if os.path.isdir(output_path):
+            shutil.copytree(output_path, cached_path)
+            size = sum(os.path.getsize(os.path.join(root, f))
+                       for root, _, files in os.walk(cached_path) for f in files)
+        else:
+            shutil.copy2(output_path, cached_path)
+            size = os.path.getsize(cached_path)
+        with self._lock:
+            self.manifest[key] = {'path': rel_path, 'size': size, 'last_access': time.time()}
+            self._evict()
+            self.save_manifest()
+        return cached_path
+
+
+    def _evict(self):
+        """ remove the least recently used entries till the cache is within size limit"""
+        with self._lock:
+            total = sum(entry['size'] for entry in self.manifest.values())
+            if total <= self.max_size:
+                return
+            for key, entry in sorted(self.manifest.items(), key=lambda x: x[1]['last_access']):
+                if total <= self.max_size:
+                    break
+                cached_path = os.path.join(self.cache_dir, entry['path'])
+                try:
+                    shutil.rmtree(cached_path) if os.path.isdir(cached_path) else os.remove(cached_path)
+                except FileNotFoundError:
+                    pass
+                total -= entry['size']
+                del self.manifest[key]
+
+
+    def save_manifest(self):
+        """ save the manifest to disk, called automatically on put"""
+        with self._lock:
+            with tempfile.NamedTemporaryFile('w', dir=self.cache_dir, suffix=".tmp",
+                                             delete=False) as file:
+                json.dump(self.manifest, file)
+            os.replace(file.name, self.manifest_path)
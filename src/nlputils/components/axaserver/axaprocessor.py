@@ -12,10 +12,15 @@ import time
 import numpy as np
 import re
 import docker
-from ....nlputils.utils import check_if_imagepdf, get_config, get_files, open_file, get_page_count
+import asyncio
+import threading
+import aiohttp
+from ....nlputils.utils import check_if_imagepdf, get_config, get_files, iter_json_array, get_page_count, file_sha256, load_manifest
 server_config='../axaserver/defaultConfig.json'
 this_dir, this_filename = os.path.split(__file__)
 server_config = os.path.join(this_dir, "defaultConfig.json")
+# outputs which can be downloaded for a request
+ARTIFACTS = ['markdown','text','json','tables','simplejson']
 
 def check_input_file(file_path:str)->bool:
     """
@@ -28,7 +33,8 @@ def check_input_file(file_path:str)->bool:
     
     if extension_type in supported_filetype:
         if os.path.isfile(file_path):
-            if (extension_type == '.pdf') & check_if_imagepdf(file_path):
+            # sampled check is enough here, its only to warn about imagepdf
+            if (extension_type == '.pdf') and check_if_imagepdf(file_path, sample=5):
                 logging.warning(f"""{file_path} is of type imagepdf and using inbuilt 
                         tesseract-ocr""")
             return True
@@ -459,88 +465,411 @@ def send_documents_batch(batch: list,
         return responses
 
 
-def download_files(request_id, folder_location, filename,authfile= ""):
+def _run_async(coroutine):
+    """
+    run the coroutine to completion from sync code. If an event loop is already running
+    in this thread (ex: jupyter notebook) the coroutine is run in a separate thread with
+    its own event loop.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
 
-    if authfile =="":
-        if get_status(request_id=request_id).status_code == 201:
-            if not os.path.exists(folder_location + f"{request_id}/"):
-                os.makedirs(folder_location + f"{request_id}/")
-                new_path = folder_location + f"{request_id}/"
+    result = {}
+    def runner():
+        try:
+            result['value'] = asyncio.run(coroutine)
+        except BaseException as e:
+            result['error'] = e
+    thread = threading.Thread(target=runner)
+    thread.start()
+    thread.join()
+    if 'error' in result:
+        raise result['error']
+    return result.get('value')
+
+
+class AxaClient:
+    """
+    asyncio client for the axaparsr REST API. Keeps one pooled HTTP session for all the
+    requests and loads the auth token only once, so that hundreds of submits, status polls
+    and downloads can be kept in flight at the same time.
 
-                try:
+    Usage
+    -------------
+        async with AxaClient(url="", authfile=authfile) as client:
+            responses = await client.send_documents_batch(batch=files)
+            status = await client.get_status(request_id=responses[0]['server_response'])
 
-                    r_markdown = get_markdown(request_id=request_id)
-                    with open(new_path + f'{filename}.md', 'w') as file:
-                        file.write(r_markdown)
-                    
-                    r_text = get_text(request_id=request_id)
-                    with open(new_path+f'{filename}.txt', 'w') as file:
-                        file.write(r_text)
-                    
-                    r_json = get_json(request_id=request_id)
-                    with open(new_path + f'{filename}.json', 'w') as file:
-                        json.dump(r_json, file)  
-
-                    tables_list = get_tables_list(request_id=request_id)
-                    os.makedirs(folder_location + f"{request_id}/tables/")
-                    new_path_table = folder_location + f"{request_id}/tables/"
-                    for val in tables_list:
-                        df = get_table(request_id=request_id, page=val[0], table=val[1])
-                        df.to_csv(new_path_table+f"{val[0]}_{val[1]}.csv")
-                    try:
-                        r_simplejson = get_simplejson(request_id=request_id)
-                        with open(new_path+f'{filename}.simple.json', 'w') as file:
-                            json.dump(r_simplejson, file)
-                    except Exception as e:
-                        logging.error(e)
-                    
-                    return new_path
-                except Exception as e:
-                    logging.error(e)
-
-                
-            
-            else: logging.warning("folder already exists")
-        
-    else:
-        if get_status(request_id=request_id,url="",authfile=authfile).status_code == 201:
-            if not os.path.exists(folder_location + f"{request_id}/"):
-                os.makedirs(folder_location + f"{request_id}/")
-                new_path = folder_location + f"{request_id}/"
+    """
 
-                try:
+    def __init__(self, url:str="http://localhost:3001", authfile:str="",
+                 max_connections:int=100, max_in_flight:int=200, timeout:float=None):
+        """
+        Params
+        -------------
+        - url: either the localhost or huggingface hosted server acceptible right now
+        - authfile: private server on huggingface need auth-token, the api url and token
+                    are read from the authfile once when client is created
+        - max_connections: size of the connection pool shared by all requests
+        - max_in_flight: maximum number of requests awaiting response at any time, requests
+                    above this limit wait for a free slot
+        - timeout: total timeout in seconds for a single request, None means no timeout
+        """
+        self.url = url
+        self.headers = None
+        # we need it if using the private server on HF
+        if url != "http://localhost:3001":
+            configs = get_config(configfile_path= authfile)
+            try:
+                self.url = configs.get("axaserver","api")
+                token = configs.get("axaserver","token")
+                self.headers = {
+                            "Authorization": f"Bearer {token}"}
+            except Exception as e:
+                logging.warning(e)
+        self.max_connections = max_connections
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.session = None
+        self._semaphore = None
+
+
+    async def open(self):
+        """ create the pooled session, called automatically when used as context manager"""
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections)
+            self.session = aiohttp.ClientSession(connector=connector, headers=self.headers,
+                                    timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        return self
+
+
+    async def close(self):
+        """ close the pooled session"""
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+
+    async def __aenter__(self):
+        return await self.open()
+
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
 
-                    r_markdown = get_markdown(request_id=request_id,url="",authfile=authfile)
-                    with open(new_path + f'{filename}.md', 'w') as file:
-                        file.write(r_markdown)
-                    
-                    r_text = get_text(request_id=request_id,url="",authfile=authfile)
-                    with open(new_path+f'{filename}.txt', 'w') as file:
-                        file.write(r_text)
-                    
-                    r_json = get_json(request_id=request_id,url="",authfile=authfile)
-                    with open(new_path + f'{filename}.json', 'w') as file:
-                        json.dump(r_json, file)  
-
-                    tables_list = get_tables_list(request_id=request_id,url="",authfile=authfile)
-                    os.makedirs(folder_location + f"{request_id}/tables/")
-                    new_path_table = folder_location + f"{request_id}/tables/"
-                    for val in tables_list:
-                        df = get_table(request_id=request_id,url="",authfile=authfile, page=val[0], table=val[1])
-                        df.to_csv(new_path_table+f"{val[0]}_{val[1]}.csv")
-                    try:
-                        r_simplejson = get_simplejson(request_id=request_id,url="",authfile=authfile)
-                        with open(new_path+f'{filename}.simple.json', 'w') as file:
-                            json.dump(r_simplejson, file)
-                    except Exception as e:
-                        logging.error(e)
-                    return new_path
-                except Exception as e:
-                    logging.error(e)
-
-                
-            
-            else: logging.warning("folder already exists")
+
+    async def _request(self, method:str, path:str, read:Literal['text','json',None]='text', **kwargs):
+        """
+        make the request to server and return tuple(status_code, body), the body is read
+        as per 'read' value, if read is None body is not read.
+        """
+        if self.session is None:
+            await self.open()
+        async with self._semaphore:
+            async with self.session.request(method, self.url + path, **kwargs) as r:
+                if read == 'json':
+                    text = await r.text()
+                    body = json.loads(text) if text != "" else text
+                elif read == 'text':
+                    body = await r.text()
+                else:
+                    body = None
+                return r.status, body
+
+
+    async def send_doc(self, file_path:str, server_config:str=server_config,
+                       check_file:bool=True)->dict:
+        """
+        Make the post request to axaserver to process the file, check the send_doc for
+        Return values. If check_file the file is validated with check_input_file before
+        sending, invalid files are not sent and get status_code None.
+        """
+        if check_file and not await asyncio.to_thread(check_input_file, file_path):
+            return {
+            'filename': os.path.basename(file_path),
+            'config': server_config,
+            'status_code': None,
+            'server_response': None}
+        try:
+            with open(file_path, 'rb') as file, open(server_config, 'rb') as config:
+                packet = aiohttp.FormData()
+                packet.add_field('file', file, filename=file_path, content_type='application/pdf')
+                packet.add_field('config', config, filename=server_config,
+                                 content_type='application/json')
+                status_code, text = await self._request('POST', "/api/v1/document", data=packet)
+            return {
+            'filename': os.path.basename(file_path),
+            'config': server_config,
+            'status_code': status_code,
+            'server_response': text}
+        except Exception as e:
+            logging.error(e)
+            return {
+            'filename': os.path.basename(file_path),
+            'config': server_config,
+            'status_code': 403,
+            'server_response': None}
+
+
+    async def send_documents_batch(self, batch:list, server_config:str=server_config,
+                                   check_file:bool=True)->list:
+        """
+        send all the documents(filepaths) in batch to server concurrently, returns the list
+        of responses in same order as batch (check send_documents_batch for Return values)
+        """
+        responses = await asyncio.gather(*[self.send_doc(file_path=file, server_config=server_config,
+                                                         check_file=check_file)
+                                            for file in batch])
+        return [{**response, **{'file_path':file}} for file, response in zip(batch, responses)]
+
+
+    async def get_status(self, request_id:str="")->int:
+        """ returns the status code of request, 201 means that the output is ready"""
+        if request_id == "":
+            raise Exception('No request ID provided')
+        status_code, _ = await self._request('GET', f'/api/v1/queue/{request_id}', read=None)
+        return status_code
+
+
+    async def wait_for_request(self, request_id:str, timeout:float=None, poll_interval:float=2,
+                               max_poll_interval:float=30, backoff:float=1.5)->int:
+        """
+        poll the status of request with adaptive backoff till the server is done with it
+
+        Params
+        ---------------
+        - request_id: The ID of the request to be queried
+        - timeout: maximum time in seconds to wait, None means wait till server is done
+        - poll_interval: initial wait time between two status checks
+        - max_poll_interval: upper limit for wait time between two status checks
+        - backoff: multiplier applied to the wait time after every status check
+
+        Return
+        ----------------
+        last status code of request, 201 if output is ready
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                status_code = await self.get_status(request_id=request_id)
+            except aiohttp.ClientError as e:
+                logging.warning(e)
+                status_code = None
+            # 200/202 means request is still in queue or being processed
+            if status_code not in [None, 200, 202]:
+                return status_code
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return status_code
+                poll_interval = min(poll_interval, remaining)
+            await asyncio.sleep(poll_interval)
+            poll_interval = min(poll_interval*backoff, max_poll_interval)
+
+
+    async def wait_until_ready(self, timeout:float=120, poll_interval:float=1)->bool:
+        """
+        readiness probe, waits till the server accepts the connections again (ex: after
+        container restart). Returns True if server is ready within timeout else False
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                await self._request('GET', "/", read=None)
+                return True
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                await asyncio.sleep(poll_interval)
+        return False
+
+
+    async def _get_output(self, output:str, request_id:str, read:str, check_status:bool):
+        """
+        fetch the output type for request-id, if check_status the server status on the
+        request id is checked before we make the call.
+        """
+        if request_id == "":
+            raise Exception('No request ID provided')
+        if check_status:
+            server_status = await self.get_status(request_id=request_id)
+            if server_status != 201:
+                return {'request_id': request_id, 'server_response': server_status}
+        _, body = await self._request('GET', f'/api/v1/{output}/{request_id}', read=read)
+        if body != "":
+            return body
+        else:
+            return {'request_id': request_id, 'server_response': body}
+
+
+    async def get_json(self, request_id:str="", check_status:bool=True):
+        """ Get the standard json output, check get_json for Return values"""
+        return await self._get_output('json', request_id, read='json', check_status=check_status)
+
+
+    async def get_simplejson(self, request_id:str="", check_status:bool=True):
+        """ Get the simple-json output, check get_simplejson for Return values"""
+        return await self._get_output('simple-json', request_id, read='json',
+                                      check_status=check_status)
+
+
+    async def get_markdown(self, request_id:str="", check_status:bool=True):
+        """ Get the markdown output, check get_markdown for Return values"""
+        return await self._get_output('markdown', request_id, read='text', check_status=check_status)
+
+
+    async def get_text(self, request_id:str="", check_status:bool=True):
+        """ Get the raw text output, check get_text for Return values"""
+        return await self._get_output('text', request_id, read='text', check_status=check_status)
+
+
+    async def get_tables_list(self, request_id:str="", check_status:bool=True):
+        """ Get the tables list, check get_tables_list for Return values"""
+        r = await self._get_output('csv', request_id, read='text', check_status=check_status)
+        if isinstance(r, dict):
+            return r
+        return [(table.rsplit('/')[-2], table.rsplit('/')[-1])
+                for table in literal_eval(r)]
+
+
+    async def get_table(self, request_id:str="", page=None, table=None, seperator=";",
+                        column_names:list=None, check_status:bool=True):
+        """ Get a particular table for a request id, check get_table for Return values"""
+        if request_id == "":
+            raise Exception('No request ID provided')
+        if check_status:
+            server_status = await self.get_status(request_id=request_id)
+            if server_status != 201:
+                return {'request_id': request_id, 'server_response': server_status}
+        if page is None or table is None:
+            raise Exception('No Page or Table number provided')
+        _, r = await self._request('GET', f'/api/v1/csv/{request_id}/{page}/{table}', read='text')
+        if r == "":
+            return r
+        try:
+            df = pd.read_csv(StringIO(r), sep=seperator, names=column_names)
+            df = df.where((pd.notnull(df)), " ")
+            return df
+        except Exception:
+            return r
+
+
+    async def _stream_to_file(self, output:str, request_id:str, file_path:str):
+        """ stream the output type for request-id straight to file without holding it in memory"""
+        async with self._semaphore:
+            async with self.session.get(f'{self.url}/api/v1/{output}/{request_id}') as r:
+                r.raise_for_status()
+                with open(file_path, 'wb') as file:
+                    async for chunk in r.content.iter_chunked(1 << 16):
+                        file.write(chunk)
+        if os.path.getsize(file_path) == 0:
+            raise Exception(f'empty {output} output for {request_id}')
+
+
+    async def _download_tables(self, request_id:str, tables_path:str):
+        """ fetch all the tables of request concurrently and save them as csv"""
+        tables_list = await self.get_tables_list(request_id=request_id, check_status=False)
+        if isinstance(tables_list, dict):
+            raise Exception(f'tables list not available for {request_id}')
+        os.makedirs(tables_path, exist_ok=True)
+        tables = await asyncio.gather(*[self.get_table(request_id=request_id, page=val[0],
+                                                table=val[1], check_status=False)
+                                        for val in tables_list])
+        for val, df in zip(tables_list, tables):
+            if isinstance(df, pd.DataFrame):
+                df.to_csv(tables_path + f"{val[0]}_{val[1]}.csv")
+            else:
+                with open(tables_path + f"{val[0]}_{val[1]}.csv", 'w') as file:
+                    file.write(df)
+
+
+    async def download_request(self, request_id:str, folder_location:str, filename:str,
+                               artifacts:list=None):
+        """
+        download the outputs of request-id, all the artifacts are fetched concurrently and
+        json/text outputs are streamed straight to disk. The outputs are saved to 
+        'folder_location/request_id/'
+
+        Params
+        ---------------
+        - request_id: The ID of the request to be downloaded
+        - folder_location: parent folder, sub-dir with request_id will be created
+        - filename: filename to be used for output files
+        - artifacts: list of outputs to be downloaded, acceptable values are ARTIFACTS 
+                    = ['markdown','text','json','tables','simplejson']. None means all.
+
+        Return
+        ----------------
+        new_path: folder where outputs are saved, None if output is not ready, folder already
+                exists or the download failed (failure of simple-json is only logged)
+        """
+        artifacts = ARTIFACTS if artifacts is None else artifacts
+        if await self.get_status(request_id=request_id) != 201:
+            return None
+        new_path = folder_location + f"{request_id}/"
+        if os.path.exists(new_path):
+            logging.warning("folder already exists")
+            return None
+        os.makedirs(new_path)
+
+        downloads = {'markdown': lambda: self._stream_to_file('markdown', request_id, new_path + f'{filename}.md'),
+                     'text': lambda: self._stream_to_file('text', request_id, new_path + f'{filename}.txt'),
+                     'json': lambda: self._stream_to_file('json', request_id, new_path + f'{filename}.json'),
+                     'tables': lambda: self._download_tables(request_id, new_path + "tables/"),
+                     'simplejson': lambda: self._stream_to_file('simple-json', request_id,
+                                                                 new_path + f'{filename}.simple.json')}
+        results = await asyncio.gather(*[downloads[artifact]() for artifact in artifacts],
+                                       return_exceptions=True)
+        failed = False
+        for artifact, result in zip(artifacts, results):
+            if isinstance(result, BaseException):
+                logging.error(f"{artifact} download failed for {request_id}: {result}")
+                failed = failed or artifact != 'simplejson'
+        if failed:
+            return None
+        return new_path
+
+
+class PageRateLimiter:
+    """
+    token bucket to keep the submissions to server within target throughput of pages per
+    minute. Documents larger than the bucket are allowed once the bucket is full.
+    """
+    def __init__(self, pages_per_minute:float):
+        self.rate = pages_per_minute/60
+        self.capacity = pages_per_minute
+        self.tokens = pages_per_minute
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+
+    async def acquire(self, pages:int):
+        """ wait till the 'pages' can be submitted within the target throughput"""
+        async with self._lock:
+            required = min(pages, self.capacity)
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated)*self.rate)
+                self.updated = now
+                if self.tokens >= required:
+                    self.tokens -= pages
+                    return
+                await asyncio.sleep((required - self.tokens)/self.rate)
+
+
+def download_files(request_id, folder_location, filename,authfile= "", artifacts:list=None):
+    """
+    download the outputs for request-id and save them to 'folder_location/request_id/',
+    check the AxaClient.download_request for Params and Return
+
+    """
+    url = "http://localhost:3001" if authfile == "" else ""
+    async def download():
+        async with AxaClient(url=url, authfile=authfile) as client:
+            return await client.download_request(request_id=request_id, folder_location=folder_location,
+                                                 filename=filename, artifacts=artifacts)
+    return _run_async(download())
 
 
 def get_serverconfig(config_type:Literal['default','largepdf','minimal','reduced','ocr_reduced','ocr']):
@@ -563,10 +892,36 @@ def get_serverconfig(config_type:Literal['default','largepdf','minimal','reduced
         return server_file
 
 
+def _manifest_index(manifest)->dict | None:
+    """ returns the manifest (created by utils.scan_corpus) as dict of file_path: file info"""
+    if manifest is None:
+        return None
+    return {row['file_path']: row for row in load_manifest(manifest).to_dict('records')}
+
+
+def _filter_manifest_errors(manifest:dict, batch_files:list)->list:
+    """ removes the files which could not be opened during corpus scan"""
+    valid = []
+    for file in batch_files:
+        if file in manifest and pd.notna(manifest[file]['error']):
+            logging.warning(f"{file} skipped, error in manifest: {manifest[file]['error']}")
+        else:
+            valid.append(file)
+    return valid
+
+
+def _get_page_count(manifest:dict, file_path:str)->int | None:
+    """ page count from manifest, file is opened only if its not in manifest"""
+    if manifest is not None and file_path in manifest:
+        page_count = manifest[file_path]['page_count']
+        return None if pd.isna(page_count) else int(page_count)
+    return get_page_count(file_path)
+
+
 class axaBatchProcessingLocal:
     def __init__(self,container_id:str='',
                  config:Literal['default','ocr','largepdf','minimal','reduced','ocr_reduced']='default',
-                 batch_files:list=[]):
+                 batch_files:list=[], cache=None, manifest=None):
         """
         Initialize axaBatchProcessingLocal with a list of documents and container id of 
         axaparsr to process the documents in semi-automated manner.
@@ -576,6 +931,10 @@ class axaBatchProcessingLocal:
         - container_id: ID of the container running axaparsr locally
         - config: axaparsr server config to be applied to the whole documents set
         - batch_files: list of all documents to be processed
+        - cache: nlputils.cache.ResultCache, if passed the outputs of files already processed 
+                with same config are restored from cache instead of being processed again
+        - manifest: manifest dataframe or parquet filepath created by utils.scan_corpus, if passed
+                page count and file checks are read from manifest instead of re-opening files
         """
         
         logging.basicConfig(level=logging.DEBUG,
@@ -585,6 +944,9 @@ class axaBatchProcessingLocal:
         self.batch_files = None
         self.server_file = None
         self.container_id = None
+        self.cache = cache
+        self._cache_keys = {}
+        self.manifest = _manifest_index(manifest)
         
         # check for which initial class var are provided by user
         # use user provided init params 
@@ -596,15 +958,20 @@ class axaBatchProcessingLocal:
         server_file = get_serverconfig(config)
         if server_file:
             self.server_file = server_file
+        self.config = config
 
         if len(batch_files) == 0:
             logging.error("pass the non-empty files list")
         else:
             self.batch_files = batch_files
+            if self.manifest is not None:
+                self.batch_files = _filter_manifest_errors(self.manifest, batch_files)
 
     
     def set_batch_params(self, batch_size:int=5, batch_wait_time:int=300, dynamic_wait_time:bool = False,
-                         dynamic_multiplier=9):
+                         dynamic_multiplier=9, poll_interval:float=2, max_poll_interval:float=30,
+                         ready_timeout:float=300, artifacts:list=None, batch_plan:list=None,
+                         cost_model=None, plan_slack:float=2, workers:int=5):
         """
         Set the parameters to be used for batch processing
 
@@ -613,19 +980,183 @@ class axaBatchProcessingLocal:
         - batch_size: this will be size of inner small batches to process the list of 
                     documents the optimal size depends on memory and number of cores being
                     used by axaparsr
-        - batch_wait_time: this will be wait time till inner batch will be allowed to be 
+        - batch_wait_time: this is maximum wait time till inner batch will be allowed to be 
                     processed by axaparsr, till second batch is pushed 
-                    (before the next batch is pushed, the container is restarted)
+                    (before the next batch is pushed, the container is restarted). Each document
+                    is downloaded as soon as it is done, and next batch is pushed as soon as all 
+                    documents in batch are done.
+        - dynamic_wait_time: if True the maximum wait time is page_count*dynamic_multiplier, where
+                    page_count is of largest document in inner batch
+        - poll_interval: initial wait time between two status checks of a document, the wait time 
+                    is increased with every check (adaptive backoff)
+        - max_poll_interval: upper limit for wait time between two status checks
+        - ready_timeout: maximum time to wait for container to accept requests after restart
+        - artifacts: list of outputs to be downloaded for each document, None means all 
+                    ARTIFACTS = ['markdown','text','json','tables','simplejson']
+        - batch_plan: list of batches for this config created by create_axa_batches, if passed
+                    inner batches are taken from plan and maximum wait time is 
+                    estimated_time*plan_slack. Files not in plan are batched by batch_size and
+                    batch_wait_time/dynamic_wait_time
+        - cost_model: AxaCostModel, if passed it is updated with observed processing time of 
+                    each inner batch (and saved if it has path)
+        - plan_slack: multiplier for estimated time of batch in plan to get maximum wait time
+        - workers: number of documents processed in parallel by axaparsr (cores), used to 
+                    update cost_model, should be same as passed to create_axa_batches
         """
-        self.index_end = len(self.batch_files)
-        self.batch_start = 0
         self.batch_size = batch_size
-        self.batch_end = self.batch_start + self.batch_size
         self.batch_id = 0
         self.sleep_time = batch_wait_time
         self.dynamic_wait_time = dynamic_wait_time
         self.dynamic_multiplier = dynamic_multiplier
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.ready_timeout = ready_timeout
+        self.artifacts = artifacts
+        self.batch_plan = batch_plan
+        self.cost_model = cost_model
+        self.plan_slack = plan_slack
+        self.workers = workers
+
+
+    def _get_batches(self)->list:
+        """ returns the list of inner batches as tuple(list of files, maximum wait time)"""
+        if self.batch_plan is None:
+            return self._fixed_batches(self.batch_files)
+
+        batches = []
+        pending = set(self.batch_files)
+        planned = set()
+        for batch in self.batch_plan:
+            batch_file = [f for f in batch['files'] if f in pending]
+            if batch_file:
+                batches.append((batch_file, batch['estimated_time']*self.plan_slack))
+                planned.update(batch_file)
+        # files not covered by batch_plan are batched same as without plan
+        unplanned = [f for f in self.batch_files if f not in planned]
+        if unplanned:
+            logging.warning(f"{len(unplanned)} files not in batch_plan, batched by batch_size: {unplanned}")
+            batches.extend(self._fixed_batches(unplanned))
+        return batches
+
+
+    def _fixed_batches(self, files:list)->list:
+        """ splits files into inner batches of batch_size, returns list of tuple(files, wait time)"""
+        batches = []
+        for start in range(0, len(files), self.batch_size):
+            batch_file = files[start:start + self.batch_size]
+            # wait time for inner batch to be processed
+            if self.dynamic_wait_time == False:
+                timeout = self.sleep_time
+            else:
+                page_count = max([_get_page_count(self.manifest, f) or 0 for f in batch_file])
+                timeout = page_count*self.dynamic_multiplier
+            batches.append((batch_file, timeout))
+        return batches
     
+
+    async def _process_batch(self, batch_file:list, save_to_folder:str, batch:str, timeout:float)->list:
+        """
+        send the inner batch to server, and download each document as soon as the server 
+        is done with it (status 201). Returns the list of responses with status and path_to_docs
+        """
+        # files in manifest are already checked
+        check_file = self.manifest is None or any(f not in self.manifest for f in batch_file)
+        async with AxaClient() as client:
+            batch_post = await client.send_documents_batch(batch=batch_file,server_config=self.server_file,
+                                                           check_file=check_file)
+            submitted = time.monotonic()
+            # save the repsonses as batch file, batch_id is auto-generated sequentially 
+            # these batches will be saved in tmp folder within the 'save_to_folder' directory
+            with open(f'{save_to_folder}tmp/{batch}.json', 'w') as file:
+                json.dump(batch_post, file, indent=4)
+
+            root_folder = f"{save_to_folder}tmp/{batch}/"
+            # (completion time, page count) of documents processed by server
+            completed = []
+            async def complete(response):
+                # get status code of succesfully accepted request
+                if response['status_code'] == 202:
+                    response['status'] = await client.wait_for_request(request_id=response['server_response'],
+                                            timeout=timeout, poll_interval=self.poll_interval,
+                                            max_poll_interval=self.max_poll_interval)
+                    if response['status'] == 201:
+                        completed.append((time.monotonic(), _get_page_count(self.manifest,
+                                                                            response['file_path'])))
+                else:
+                    response['status'] = None
+                # download document and save to tmp sub-dir in 'save_to_folder' location
+                if response['status'] == 201:
+                    response['path_to_docs'] = await client.download_request(
+                                            request_id=response['server_response'], folder_location=root_folder,
+                                            filename=os.path.splitext(os.path.basename(response['filename']))[0],
+                                            artifacts=self.artifacts)
+                else:
+                    response['path_to_docs'] = None
+                if self.cache is not None and self._download_complete(response):
+                    await asyncio.to_thread(self.cache.put, self._cache_keys[response['file_path']],
+                                            response['path_to_docs'])
+                return response
+            
+            responses = list(await asyncio.gather(*[complete(response) for response in batch_post]))
+
+        # documents in batch wait for each other on server, so the cost model is updated once
+        # per batch from its wall time and not from time of each document
+        if self.cost_model is not None and completed and all(pages for _, pages in completed):
+            self.cost_model.update_batch(self.config, page_count=sum(pages for _, pages in completed),
+                                         document_count=len(completed), workers=self.workers,
+                                         seconds=max(done for done, _ in completed) - submitted)
+        return responses
+
+
+    def _download_complete(self, response)->bool:
+        """ check if all the outputs of document are downloaded"""
+        if response.get('path_to_docs') is None:
+            return False
+        if self.artifacts is None or 'simplejson' in self.artifacts:
+            return os.path.isfile(response['path_to_docs'] + "/" +
+                                  os.path.splitext(response['filename'])[0] + ".simple.json")
+        return True
+
+
+    def _restore_from_cache(self, save_to_folder:str):
+        """
+        restore the outputs of files which are already in cache to 'save_to_folder/tmp/cached/'
+        and remove them from the files to be processed. The info on restored files is saved
+        in 'save_to_folder/tmp/cached.json'
+        """
+        config = {'server_config': file_sha256(self.server_file), 'artifacts': self.artifacts}
+        restored = []
+        pending = []
+        for file in self.batch_files:
+            try:
+                key = self.cache.make_key(file, processor='axaparsr', config=config)
+            except Exception as e:
+                logging.warning(e)
+                pending.append(file)
+                continue
+            self._cache_keys[file] = key
+            path_to_docs = self.cache.get(key, restore_to=f"{save_to_folder}tmp/cached/{key}/")
+            if path_to_docs is None:
+                pending.append(file)
+            else:
+                restored.append({'filename': os.path.basename(file), 'config': self.server_file,
+                                 'status_code': None, 'server_response': None, 'file_path': file,
+                                 'status': 201, 'path_to_docs': path_to_docs})
+        if restored:
+            with open(f'{save_to_folder}tmp/cached.json', 'w') as file:
+                json.dump(restored, file, indent=4)
+        logging.info(f"{len(restored)} files restored from cache, {len(pending)} files to be processed")
+        self.batch_files = pending
+
+
+    async def _restart_container(self, docker_client)->bool:
+        """ restart the container to clear cache and wait till server is up and running"""
+        container = docker_client.containers.get(self.container_id)
+        container.stop()
+        container.start()
+        async with AxaClient() as client:
+            return await client.wait_until_ready(timeout=self.ready_timeout)
+
     
     def processing(self,save_to_folder:str = ''):
         """
@@ -651,66 +1182,45 @@ class axaBatchProcessingLocal:
         except Exception as e:
             logging.error("docker not activated")
 
-
+        # files already processed are taken from cache
+        if self.cache is not None:
+            self._restore_from_cache(save_to_folder)
         
-        # loop thorugh the documents list, create the batch and process them
-        while self.index_end > self.batch_start:
-            if self.batch_end <=self.index_end:
-                batch_file = self.batch_files[self.batch_start:self.batch_end]
-            else:
-                batch_file = self.batch_files[self.batch_start:]
-            # send the batch to server
+        # loop thorugh the inner batches and process them
+        for batch_file, timeout in self._get_batches():
             batch = f"batch_{self.batch_id}"
             
             if os.path.isdir(f'{save_to_folder}tmp/{batch}'):
                 logging.warning(f'{save_to_folder}tmp/{batch}  exists')
                 self.batch_id +=1
-                self.batch_start = self.batch_end
-                self.batch_end = self.batch_start + self.batch_size
-            else:
-                batch_post = send_documents_batch(batch=batch_file,server_config=self.server_file)
-                # create the dataframe of repsonses and save it as batch file
-                # batch_id is auto-generated sequentially these batches will be saved in tmp folder
-                # within the 'save_to_folder' directory
-                df = pd.DataFrame(batch_post)
-                jsonfile = df.to_json(orient="records")
-                parsed = json.loads(jsonfile)
-                with open(f'{save_to_folder}tmp/{batch}.json', 'w') as file:
-                    json.dump(parsed, file, indent=4)
-
-                # wait time for inner batch to be processed
-                if self.dynamic_wait_time == False:
-                    time.sleep(self.sleep_time)
-                else:
-                    page_count = max([get_page_count(f) for f in batch_file])
-                    time.sleep(page_count*self.dynamic_multiplier)
-
-                # get status code of succesfully accepted request
-                df['status'] = df.apply(lambda x: get_status(request_id=x['server_response'])\
-                                        .status_code if x['status_code']==202 else None,axis=1 )
-                
-                # download inner batch and save to tmp sub-dir in 'save_to_folder' location
-                root_folder = f"{save_to_folder}tmp/{batch}/"
-                df['path_to_docs'] = df.apply(lambda x: download_files(x['server_response'],root_folder,
-                                            os.path.splitext(os.path.basename(x['filename']))[0]),axis=1)
-                jsonfile = df.to_json(orient="records")
-                parsed = json.loads(jsonfile)
-                with open(f'{save_to_folder}tmp/{batch}.json', 'w') as file:
-                    json.dump(parsed, file, indent=4)
-        
-                logging.info("batch",self.batch_id,"done")
+                # without cache existing batch folder means that batch is processed already
+                if self.cache is None:
+                    continue
+                # with cache the resume is done on file content, so existing batch folder
+                # only means that this batch_id is taken
+                while os.path.isdir(f'{save_to_folder}tmp/batch_{self.batch_id}'):
+                    self.batch_id +=1
+                batch = f"batch_{self.batch_id}"
+
+            # send, wait for completion and download the inner batch
+            batch_post = _run_async(self._process_batch(batch_file=batch_file,
+                                        save_to_folder=save_to_folder, batch=batch, timeout=timeout))
+            df = pd.DataFrame(batch_post)
+            jsonfile = df.to_json(orient="records")
+            parsed = json.loads(jsonfile)
+            with open(f'{save_to_folder}tmp/{batch}.json', 'w') as file:
+                json.dump(parsed, file, indent=4)
+    
+            logging.info(f"batch {self.batch_id} done")
+            if self.cost_model is not None and self.cost_model.path is not None:
+                self.cost_model.save()
 
-                # restart the container to clear cache
-                container = client.containers.get(self.container_id)
-                container.stop()
-                container.start()
+            # restart the container to clear cache, and wait till its up and running
+            if not _run_async(self._restart_container(client)):
+                logging.warning(f"container not ready after {self.ready_timeout} sec")
 
-                # increase the batch iteration value and update related values
-                self.batch_id +=1
-                self.batch_start = self.batch_end
-                self.batch_end = self.batch_start + self.batch_size
-                # sleep time to allow the container to be up and running
-                time.sleep(20)
+            # increase the batch iteration value
+            self.batch_id +=1
         logging.info("jobs completed")
         batch_files = glob.glob(save_to_folder+'tmp/*.json')
         df = pd.concat([pd.read_json(file) for file in batch_files], ignore_index=True)
@@ -727,7 +1237,7 @@ class axaBatchProcessingLocal:
 class axaBatchProcessingHF:
     def __init__(self,authfile,
                  config:Literal['default','ocr','largepdf','minimal','reduced','ocr_reduced']='default',
-                 batch_files:list=[]):
+                 batch_files:list=[], manifest=None):
         """
         Initialize axaBatchProcessingLocal with a list of documents and container id of 
         axaparsr to process the documents in semi-automated manner.
@@ -737,6 +1247,8 @@ class axaBatchProcessingHF:
         - container_id: ID of the container running axaparsr locally
         - config: axaparsr server config to be applied to the whole documents set
         - batch_files: list of all documents to be processed
+        - manifest: manifest dataframe or parquet filepath created by utils.scan_corpus, if passed
+                page count and file checks are read from manifest instead of re-opening files
         """
         
         logging.basicConfig(level=logging.DEBUG,
@@ -748,139 +1260,423 @@ class axaBatchProcessingHF:
         self.authfile = authfile
         self.df_placeholder = []
         self.current_batch = []
+        self.manifest = _manifest_index(manifest)
         
 
         if len(batch_files) == 0:
             logging.error("pass the non-empty files list")
         else:
             self.batch_files = batch_files
+            if self.manifest is not None:
+                self.batch_files = _filter_manifest_errors(self.manifest, batch_files)
         
         server_file = get_serverconfig(config)
         if server_file:
             self.server_file = server_file
         
     
-    def set_batch_params(self, batch_size:int=10, batch_wait_time:int=120):
+    def set_batch_params(self, batch_size:int=10, batch_wait_time:int=120, retries:int=2,
+                         doc_timeout:float=None, pages_per_minute:float=None, poll_interval:float=5,
+                         artifacts:list=None):
         """
         Set the parameters to be used for batch processing
 
         Params
         ---------------
-        - batch_size: this will be size of inner small batches to process the list of 
-                    documents the optimal size depends on memory and number of cores being
-                    used by axaparsr
-        - batch_wait_time: this will be wait time till inner batch will be allowed to be 
-                    processed by axaparsr, till second batch is pushed 
-                    (before the next batch is pushed, the container is restarted)
+        - batch_size: number of documents in flight on the server at any time (sliding window),
+                    a new file is submitted the moment a document is done. The optimal size 
+                    depends on memory and number of cores being used by axaparsr
+        - batch_wait_time: upper limit for wait time between two status checks of a document,
+                    the wait time starts at poll_interval and is increased with every check
+        - retries: number of times a document is re-submitted if submission, processing or 
+                    download fails
+        - doc_timeout: maximum time in seconds to wait for a single document to be processed 
+                    before its retried, None means wait till server is done
+        - pages_per_minute: target throughput, the submissions are throttled to stay within it.
+                    None means no throttling
+        - poll_interval: initial wait time between two status checks of a document
+        - artifacts: list of outputs to be downloaded for each document, None means all 
+                    ARTIFACTS = ['markdown','text','json','tables','simplejson']
         """
         self.batch_size = batch_size
         self.sleep_time = batch_wait_time
-        
-    
-    def _get_batch_status(self,response_file):
-        for f in response_file:
-            server_status = get_status(url=None, authfile=self.authfile, request_id=f['server_response'])
-            f['status'] = server_status.status_code
-        return response_file
+        self.retries = retries
+        self.doc_timeout = doc_timeout
+        self.pages_per_minute = pages_per_minute
+        self.poll_interval = poll_interval
+        self.artifacts = artifacts
+
+
+    def _save_progress(self, save_to_folder):
+        """ save the processed files and the files currently in flight"""
+        with open(save_to_folder + 'tmp/hf_batch_files.json', 'w') as file:
+            json.dump(self.df_placeholder, file, indent=4)
+        with open(save_to_folder + 'tmp/current_batch.json', 'w') as file:
+            json.dump(self.current_batch, file, indent=4)
+
+
+    async def _process_file(self, client, file_path, limiter, save_to_folder)->dict:
+        """
+        submit the file, wait for server to be done with it and download it. In case of 
+        failure the file is re-submitted for 'retries' times.
+        """
+        page_count = await asyncio.to_thread(_get_page_count, self.manifest, file_path)
+        # files in manifest are already checked
+        check_file = self.manifest is None or file_path not in self.manifest
+        # same as send_doc when request could not be made, kept if every attempt raises
+        r = {'filename': os.path.basename(file_path), 'config': self.server_file,
+             'status_code': 403, 'server_response': None, 'file_path': file_path,
+             'attempts': 0, 'status': None, 'path_to_docs': None}
+        for attempt in range(self.retries + 1):
+            if limiter is not None:
+                await limiter.acquire(page_count or 1)
+            try:
+                r = await client.send_doc(file_path=file_path, server_config=self.server_file,
+                                          check_file=check_file)
+                r['file_path'] = file_path
+                r['attempts'] = attempt + 1
+                r['status'] = None
+                r['path_to_docs'] = None
+                # file not valid for axaparsr, no need to retry
+                if r['status_code'] is None:
+                    return r
+                if r['status_code'] == 202:
+                    self.current_batch.append(r)
+                    r['status'] = await client.wait_for_request(request_id=r['server_response'],
+                                        timeout=self.doc_timeout, poll_interval=self.poll_interval,
+                                        max_poll_interval=self.sleep_time)
+                    if r['status'] == 201:
+                        r['path_to_docs'] = await client.download_request(request_id=r['server_response'],
+                                        folder_location=save_to_folder + 'tmp/',
+                                        filename=os.path.splitext(os.path.basename(r['filename']))[0],
+                                        artifacts=self.artifacts)
+                        if r['path_to_docs'] is not None:
+                            return r
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # transient network error only fails this attempt, not the whole window
+                logging.warning(f"{file_path} attempt {attempt + 1} raised {type(e).__name__}: {e}")
+                r['attempts'] = attempt + 1
+            finally:
+                if r in self.current_batch:
+                    self.current_batch.remove(r)
+            logging.warning(f"{file_path} failed in attempt {attempt + 1}, status:{r['status_code']}/{r['status']}")
+        return r
+
+
+    async def _worker(self, client, limiter, save_to_folder):
+        """ one slot of sliding window, keeps taking next file till there are none left"""
+        while self.batch_files:
+            file_path = self.batch_files.pop(0)
+            r = await self._process_file(client=client, file_path=file_path, limiter=limiter,
+                                         save_to_folder=save_to_folder)
+            self.df_placeholder.append(r)
+            self._save_progress(save_to_folder)
+
+
+    async def _run(self, save_to_folder):
+        limiter = PageRateLimiter(self.pages_per_minute) if self.pages_per_minute else None
+        async with AxaClient(url="", authfile=self.authfile) as client:
+            results = await asyncio.gather(*[self._worker(client=client, limiter=limiter, 
+                                                          save_to_folder=save_to_folder)
+                                             for _ in range(self.batch_size)],
+                                           return_exceptions=True)
+        # unexpected error only stops its own slot, other slots finish the remaining files
+        for result in results:
+            if isinstance(result, BaseException):
+                logging.error(f"window slot stopped: {result}")
+
 
     def processing(self, save_to_folder:str = ''):
+        """
+        start the processing with sliding window of 'batch_size' documents in flight, 
+        will save all output to the 'save_to_folder'
+
+        Params
+        ------------
+        - save_to_folder: the local of folder where to store all the outputs
+
+        Return 
+        -----------
+        df: dataframe with info on each file
+        """
         if not os.path.exists(save_to_folder):
             os.makedirs(save_to_folder)
         if not os.path.exists(save_to_folder+'tmp/'):
             os.makedirs(save_to_folder+'tmp/')
 
-
-        while self.batch_files:
-        # Add files to the current batch until it's full or there are no more files to process
-            while len(self.current_batch) < self.batch_size and self.batch_files:
-                r = send_doc(url="",file_path=self.batch_files[0],server_config=self.server_file,
-                                        authfile=self.authfile)
-                r['file_path'] = self.batch_files[0]
-                self.current_batch.append(r)
-                self.batch_files.pop(0)
-
-            # wait time 
-            time.sleep(self.sleep_time)
-            # Simulate processing of some files in the batch
-            self.current_batch = self._get_batch_status(response_file=self.current_batch)
-            for i,f in enumerate(self.current_batch):
-                if f['status'] == 201:
-                    self.current_batch[i]['path_to_docs'] = download_files(f['server_response'],save_to_folder + 'tmp/',
-                                                    os.path.splitext(os.path.basename(f['filename']))[0], authfile=self.authfile)
-                    self.df_placeholder.append(self.current_batch[i])
-                    self.current_batch.pop(i)
-            
-            with open(save_to_folder + 'tmp/hf_batch_files.json', 'w') as file:
-                json.dump(self.df_placeholder, file, indent=4)
-                
-            # Add more files to the batch if it's not full
-            while len(self.current_batch) < self.batch_size and self.batch_files:
-                r = send_doc(url="",file_path=self.batch_files[0],server_config=self.server_file,
-                                            authfile=self.authfile)
-                r['file_path'] = self.batch_files[0]
-                self.current_batch.append(r)
-                self.batch_files.pop(0)
-            self.current_batch = self._get_batch_status(response_file=self.current_batch)
-            with open(save_to_folder + 'tmp/current_batch.json', 'w') as file:
-                json.dump(self.current_batch, file, indent=4)
-        logging.info("total files processed:", len(self.df_placeholder))
-        logging.info("waiting for last batch")
-
-        while self.current_batch:
-            self.current_batch = self._get_batch_status(response_file=self.current_batch)
-            for i,f in enumerate(self.current_batch):
-                if f['status'] == 201:
-                    self.current_batch[i]['path_to_docs'] = download_files(f['server_response'],save_to_folder + 'tmp/',
-                                                    os.path.splitext(os.path.basename(f['filename']))[0], authfile=self.authfile)
-                    self.df_placeholder.append(self.current_batch[i])
-                    self.current_batch.pop(i)
-            with open(save_to_folder + 'tmp/current_batch.json', 'w') as file:
-                json.dump(self.current_batch, file, indent=4)
-            with open(save_to_folder + 'tmp/hf_batch_files.json', 'w') as file:
-                json.dump(self.df_placeholder, file, indent=4) 
-            time.sleep(self.sleep_time)
+        _run_async(self._run(save_to_folder))
         
-        logging.info("jobs completed")
+        logging.info(f"total files processed: {len(self.df_placeholder)}")
         for f in self.df_placeholder:
             f['simple_json_download_successful'] = os.path.isfile(f['path_to_docs']+"/"+
-                                            os.path.splitext(f['filename'])[0] +".simple.json" ) 
+                                            os.path.splitext(f['filename'])[0] +".simple.json" ) \
+                                            if f['path_to_docs'] is not None else False
 
-        with open(save_to_folder + 'tmp/hf_batch_files.json', 'w') as file:
-            json.dump(self.df_placeholder, file, indent=4)   
+        self._save_progress(save_to_folder)
 
         logging.info("jobs completed") 
 
         return pd.DataFrame(self.df_placeholder)
         
 
-def create_axa_batches(df):
+class AxaCostModel:
+    """
+    per page cost model for each axaparsr config, used by create_axa_batches to plan the batches.
+    The processing time per page is updated from observed timings (exponential moving average).
+    Default values are from experience: ~1 min for 10 pages, ~2 min for 10 pages with OCR on 
+    single core, 10 documents of 30-40 pages need ~16GB RAM.
+    """
+    default_seconds_per_page = {'default': 6, 'largepdf': 3, 'minimal': 2, 'reduced': 4,
+                                'ocr_reduced': 10, 'ocr': 12}
+    default_memory_per_page = {'default': 40, 'largepdf': 25, 'minimal': 15, 'reduced': 30,
+                               'ocr_reduced': 40, 'ocr': 50}
+
+    def __init__(self, path:str=None, overhead:float=10, smoothing:float=0.2):
+        """
+        Params
+        -------------
+        - path: json filepath to load/save the model, if the file exists the model is loaded
+        - overhead: fixed time in seconds per document (upload, parsing setup, download)
+        - smoothing: weight of new observation in the moving average of time per page
+        """
+        self.path = path
+        self.overhead = overhead
+        self.smoothing = smoothing
+        self.seconds_per_page = dict(self.default_seconds_per_page)
+        self.memory_per_page = dict(self.default_memory_per_page)
+        if path is not None and os.path.isfile(path):
+            with open(path) as file:
+                model = json.load(file)
+            self.seconds_per_page.update(model.get('seconds_per_page', {}))
+            self.memory_per_page.update(model.get('memory_per_page', {}))
+            self.overhead = model.get('overhead', overhead)
+
+
+    def estimate_time(self, config:str, page_count:int)->float:
+        """ estimated processing time in seconds for document"""
+        return self.overhead + page_count*self.seconds_per_page[config]
+
+
+    def estimate_memory(self, config:str, page_count:int)->float:
+        """ estimated memory in MB needed to process the document"""
+        return page_count*self.memory_per_page[config]
+
+
+    def update(self, config:str, page_count:int, seconds:float):
+        """ update the time per page for config from the observed processing time of document"""
+        observed = max(seconds - self.overhead, 0)/page_count
+        self.seconds_per_page[config] = ((1 - self.smoothing)*self.seconds_per_page[config]
+                                         + self.smoothing*observed)
+
+
+    def update_batch(self, config:str, page_count:int, document_count:int, seconds:float,
+                     workers:int=5):
+        """
+        update the time per page for config from the observed wall time of batch, where 
+        documents are processed 'workers' at a time (inverse of batch estimate in 
+        create_axa_batches: total time of documents/workers)
+
+        Params
+        -------------
+        - page_count: total pages of documents in batch
+        - document_count: number of documents in batch
+        - seconds: wall time from submitting the batch till last document is done
+        - workers: number of documents processed in parallel by axaparsr
+        """
+        busy = seconds*min(workers, document_count)
+        observed = max(busy - self.overhead*document_count, 0)/page_count
+        self.seconds_per_page[config] = ((1 - self.smoothing)*self.seconds_per_page[config]
+                                         + self.smoothing*observed)
+
+
+    def save(self, path:str=None):
+        """ save the model as json"""
+        path = path or self.path
+        with open(path, 'w') as file:
+            json.dump({'seconds_per_page': self.seconds_per_page, 'memory_per_page': self.memory_per_page,
+                       'overhead': self.overhead}, file, indent=4)
+
+
+def create_axa_batches(df, cost_model:AxaCostModel=None, time_budget:float=1800,
+                       memory_budget_mb:float=16000, workers:int=5, file_column:str='file_path',
+                       large_pdf_pages:int=150, ocr_ratio:float=0.5):
     """
-    returns the batches based on page_count thresholds [page_count<=10, 10<page_count<=25,
-    25<page_count<=50, 50<page_count<=100, page_count>100]
+    plans the batches by bin-packing the documents, such that each batch fills the time and 
+    memory budget. Documents of similar cost are packed together so that no single document
+    becomes the long tail of batch.
+
+    Params
+    ---------------
+    - df: dataframe with file_column and page_count columns, or the manifest (dataframe/parquet 
+            filepath) created by utils.scan_corpus
+    - cost_model: AxaCostModel to estimate time/memory per document, default model if None
+    - time_budget: target time in seconds for each batch
+    - memory_budget_mb: memory available to axaparsr, sum of estimated memory of documents in 
+            batch does not exceed it
+    - workers: number of documents processed in parallel by axaparsr (cores), estimated time of 
+            batch is max(largest document, total time/workers)
+    - file_column: column with filepath
+    - large_pdf_pages: documents with more pages use 'largepdf' config
+    - ocr_ratio: documents with scanned_page_ratio (from manifest) above this use 'ocr' config
 
     Returns
     ---------------
-    placeholder:dic where  key = 'verysmall'|'small'|'medium'|'large'|'verlarge', 
-            value = [dataframe of file list,minibatch size,minibatch wait time, config type to be used]
+    placeholder: dict where key = config type ('default'|'largepdf'|'ocr'), value = list of 
+            batches, where batch = {'files': list of filepaths, 'page_count': total pages,
+            'estimated_time': seconds, 'estimated_memory': MB}. Documents without page_count
+            get a batch of their own with config 'largepdf'.
     
     """
-    partition_thresholds = {'verysmall':[10,10,120,'defaut'],'small':[25,10,300,'default'],'medium':[50,8,600,'default'],'large':[150,5,600,'largepdf'],}
-    nan_df = df[df.page_count.isna()]
-    df = df[df.page_count.notna()].reset_index(drop=True)
-    placeholder= {}
-    for key, val in partition_thresholds.items():
-        placeholder[key] = [df[df.page_count <=val[0]].reset_index(drop=True),val[1],val[2]]
-        df = df[df.page_count >val[0]].reset_index(drop=True)
-    
-    # for very large batch size select the dynamic wait time option i.e why wait-time is passed None
-    placeholder['verylarge'] = [pd.concat([nan_df,df],ignore_index=True),3,None,'largepdf']
+    df = load_manifest(df)
+    cost_model = AxaCostModel() if cost_model is None else cost_model
+
+    def select_config(row):
+        scanned_page_ratio = row.get('scanned_page_ratio')
+        if scanned_page_ratio is not None and not pd.isna(scanned_page_ratio) and scanned_page_ratio > ocr_ratio:
+            return 'ocr'
+        if row['page_count'] > large_pdf_pages:
+            return 'largepdf'
+        return 'default'
+
+    placeholder = {}
+    # unknown page count, cannot be estimated so processed one at a time
+    for row in df[df.page_count.isna()].to_dict('records'):
+        placeholder.setdefault('largepdf', []).append({'files':[row[file_column]], 'page_count':None,
+                    'estimated_time':cost_model.estimate_time('largepdf', large_pdf_pages),
+                    'estimated_memory':cost_model.estimate_memory('largepdf', large_pdf_pages)})
+
+    # documents sorted by cost are packed first-fit, so that similar documents are together
+    items = {}
+    for row in df[df.page_count.notna()].to_dict('records'):
+        config = select_config(row)
+        page_count = int(row['page_count'])
+        items.setdefault(config, []).append((cost_model.estimate_time(config, page_count),
+                                             cost_model.estimate_memory(config, page_count),
+                                             page_count, row[file_column]))
+    for config, docs in items.items():
+        batches = []
+        for doc_time, doc_memory, page_count, file_path in sorted(docs, key=lambda x: x[0], reverse=True):
+            for batch in batches:
+                # batch with document larger than budget can still take documents which
+                # don't extend its time
+                estimated_time = max(batch['max_time'], (batch['total_time'] + doc_time)/workers)
+                if (estimated_time <= max(time_budget, batch['max_time']) and 
+                        batch['estimated_memory'] + doc_memory <= memory_budget_mb):
+                    break
+            else:
+                batch = {'files':[], 'page_count':0, 'estimated_time':0, 'estimated_memory':0,
+                         'max_time':doc_time, 'total_time':0}
+                batches.append(batch)
+            batch['files'].append(file_path)
+            batch['page_count'] += page_count
+            batch['total_time'] += doc_time
+            batch['estimated_memory'] += doc_memory
+            batch['estimated_time'] = max(batch['max_time'], batch['total_time']/workers)
+        for batch in batches:
+            del batch['max_time'], batch['total_time']
+        placeholder.setdefault(config, []).extend(batches)
 
     return placeholder
 
 
+def _check_column_header(string_list):
+    """
+    check if the first entry in content type table is valid column header or not 
+    returns tuple (bool,listofstring)
+
+    """
+    match = [bool(re.search(r'\*\*(.*?)\*\*', str(text))) for text in string_list]
+    if sum(match)/len(match)>0.6:
+        return True, [re.sub(r'\*\*', '', str(text)) for text in string_list]
+    else:
+        return False, [re.sub(r'\*\*', '', str(text)) for text in string_list]
+
+
+def _is_na(value)->bool:
+    """ None and nan are the missing values in table"""
+    return value is None or (isinstance(value, float) and value != value)
+
+
+def _clean_table(element):
+    """ drops the rows and then the columns of table element which have only NA values"""
+    columns = element['columns']
+    width = len(columns)
+    # same checks as DataFrame, short rows are padded to the longest row
+    if element['content']:
+        data_width = max(len(row) for row in element['content'])
+        if data_width != width:
+            raise ValueError(f"{width} columns passed, passed data had {data_width} columns")
+    rows = []
+    for row in element['content']:
+        if not all(_is_na(value) for value in row):
+            rows.append(list(row) + [None]*(width - len(row)))
+    keep = [j for j in range(width) if any(not _is_na(row[j]) for row in rows)]
+    element['columns'] = [columns[j] for j in keep]
+    element['content'] = [[row[j] for j in keep] for row in rows]
+
+
+def _table_format(page, table_cache):
+    """
+    if table exist in page then perform formatting in two respects:
+    1. if the column header is not defiend then fetch the column header from previous page
+    2. Drop the irrelvant(NA) rows/columns
+
+    table_cache is {'page':page of last table, 'columns':its column header} carried across pages
+    """
+    for element in page['content']:
+        if element['type'] == 'table':
+            # check if proper column header,axaparsr table headers exis as list of 
+            # bold markdown strings
+            if_col_header, col_header = _check_column_header(element['content'][0])
+            if if_col_header:
+                # add separate element[key]
+                element['columns'] = col_header
+                # remove item 0 as this is now column header
+                element['content'].pop(0)
+                table_cache['columns'] = col_header
+            # if not proper column header exist, then check if len of column headers
+            # in table in previous table is of same length.
+            elif (page['page'] == table_cache['page'] + 1 and
+                        len(table_cache['columns']) == len(col_header)):
+                # assign the column headers from previous cached results
+                element['columns'] = table_cache['columns']
+            else:
+                # if none works then just add dummy column names
+                element['columns'] = [f'column_{i}' for i in range(len(col_header))]
+                table_cache['columns'] = col_header
+            table_cache['page'] = page['page']
+            _clean_table(element)
+    return page
+
+
+def iter_simple_json_pages(filepath):
+    """
+    generator version of simple_json_parsr, the simple-json file is streamed element by element
+    and each page is yielded (with formatted tables) as soon as its elements are read, so only
+    one page is held in memory
+
+    Return:
+    -----------------------
+    generator of page = {'page':page number, 'content':list of elements}, check simple_json_parsr
+    """
+    table_cache = {'page':0, 'columns':[]}
+    page = None
+    for element in iter_json_array(filepath):
+        page_number = element.pop('page') + 1
+        if page is None or page['page'] != page_number:
+            if page is not None:
+                yield _table_format(page, table_cache)
+            page = {'page':page_number, 'content':[]}
+        page['content'].append(element)
+    # last page
+    if page is not None:
+        yield _table_format(page, table_cache)
+
+
 def simple_json_parsr(filepath):
     """
-    takes filepath and returns a well formated output from simple-json file
+    takes filepath and returns a well formated output from simple-json file, the file is
+    parsed incrementally (iter_simple_json_pages)
 
     Return:
     -----------------------
@@ -895,113 +1691,19 @@ def simple_json_parsr(filepath):
             
 
     """
-    simple_json = open_file(filepath)
-    
-    def page_wise_contruct(simple_json):
-        """
-        takes simple-json and contruct list of pages
-        """
-        pages= []
-        type_list = set()
-        page = {}
-        for i in simple_json: 
-            if page:
-                if page['page'] == i['page']+1:
-                    type_list.add(i['type'])
-                    del i['page']
-                    page['content'].append(i)
-                else:
-                    pages.append(page)
-                    page={'page':i['page']+1,'content':[]}
-                    type_list.add(i['type'])
-                    del i['page']
-                    page['content'].append(i)
-            else:
-            
-                page={'page':i['page']+1,'content':[]}
-                type_list.add(i['type'])
-                del i['page']
-                page['content'].append(i)
-        return {'page_list':pages,'unique_elements_type':type_list}
-    
-    page_wise_doc = page_wise_contruct(simple_json)
-    pages= page_wise_doc['page_list']
-
-    def check_column_header(string_list):
-        """
-        check if the first entry in content type table is valid column header or not 
-        returns tuple (bool,listofstring)
-
-        """
-        match = [bool(re.search(r'\*\*(.*?)\*\*', str(text))) for text in string_list]
-        if sum(match)/len(match)>0.6:
-            return True, [re.sub(r'\*\*', '', str(text)) for text in string_list]
-        else:
-            return False, [re.sub(r'\*\*', '', str(text)) for text in string_list]
-        
-    def table_format(pages):
-        """
-        iterate through pages, and if table exist then perform formatting in two respects:
-        1. if the column header is not defiend then fetch the column header from previous page
-        2. Drop the irrelvant(NA) rows/columns
-
-        """
-        page_cache= 0
-        table_cache= []
-        for page in pages:
-            for element in page['content']:
-                if element['type'] == 'table':
-                    # check if proper column header,axaparsr table headers exis as list of 
-                    # bold markdown strings
-                    if_col_header, col_header = check_column_header(element['content'][0])
-                    if if_col_header:
-                        # add separate element[key]
-                        element['columns'] = col_header
-                        # remove item 0 as this is now column header
-                        element['content'].pop(0)
-                        table_cache = col_header
-                        page_cache = page['page']
-                    else:
-                        # if not proper column header exist, then check if len of column headers
-                        # in table in previous table is of same length.
-                        if ((page['page'] == page_cache +1) & (len(table_cache)==len(col_header))):
-                            # assign the column headers from previous cached results
-                            element['columns'] = table_cache
-                            page_cache = page['page']
-                        else:
-                            # if none works then just add dummy column names
-                            element['columns'] = [f'column_{i}' for i in range(len(col_header)) ]
-                            table_cache = col_header
-                            page_cache = page['page']
-        # once more loop through to clean the table for NA/nan
-        for page in pages:
-            for element in page['content']:
-                if element['type'] == 'table':
-                    tmp = pd.DataFrame(data = element['content'],columns=element['columns'])
-                    tmp.dropna(axis=0, how='all',inplace=True)
-                    tmp.dropna(axis=1, how='all',inplace=True)
-                    element['columns'] = list(tmp.columns)
-                    element['content'] = tmp.values.tolist()
-        return pages
-
-    pages = table_format(pages)
-    page_wise_doc['page_list'] = pages
-
-    return page_wise_doc 
+    pages = list(iter_simple_json_pages(filepath))
+    type_list = {element['type'] for page in pages for element in page['content']}
+    return {'page_list':pages,'unique_elements_type':type_list}
 
 
 def get_pagewise_text(filepath):
     """constructs page wise raw text from simple-json, 
     returns the list of dictionary with page_number and content """
 
-    tmp = simple_json_parsr(filepath)
-    page_wise_output = tmp['page_list']
-    
-    for page in page_wise_output:
-        tmp = []
-        for element in page['content']:
-            tmp.append(str(element['content']))
-        page['content'] = "\n".join(tmp)
+    page_wise_output = []
+    for page in iter_simple_json_pages(filepath):
+        page['content'] = "\n".join(str(element['content']) for element in page['content'])
+        page_wise_output.append(page)
 
     return page_wise_output
 
@@ -53,51 +53,75 @@ def load_tables(tables_path):
         
         return table_list
 
+def _is_text(para)->bool:
+    """ only paragraph and heading elements are sanitized for token count"""
+    return (para['metadata']['type'] =='paragraph') or (para['metadata']['type'] =='heading')
+
+
+def _split_last(new_paragraphs, token_count, upper_threshold):
+    """ splits the last paragraph into chunks of upper_threshold tokens if it is too long"""
+    if token_count < upper_threshold:
+        return
+    para = new_paragraphs.pop()
+    para_tokens = str(para['content']).split()
+    for i in range(0, len(para_tokens), upper_threshold):
+        new_paragraphs.append({'content':" ".join(para_tokens[i:i + upper_threshold]),
+                               'metadata':dict(para['metadata'])})
+
+
 def paragraph_sanitize(paragraphs, lower_threshold, upper_threshold):
     """
-    takes paragraphs list and sanitizes it for token lower/upper count threshold
+    takes paragraphs list and sanitizes it for token lower/upper count threshold, in one pass:
+    paragraph/heading with token count not above lower_threshold is appended to previous 
+    paragraph/heading, and paragraph/heading with upper_threshold or more tokens (also after
+    appending) is split into chunks of upper_threshold tokens. Token count of each paragraph
+    is computed once, so the result is final (no need to call it again)
 
     """
     logging.basicConfig(level=logging.DEBUG,
                             format='%(name)s - %(levelname)s - %(message)s')
     # new placeholder
     new_paragraphs = []
+    # token count of last paragraph in new list, None if it is not paragraph/heading
+    last_count = None
+    # if the last paragraph is a copy which can be modified
+    last_copied = False
     # iterate through the paragraphs list
     for para in paragraphs:
-        # if element type is paragraph then sanitize it
-        if (para['metadata']['type'] =='paragraph') or (para['metadata']['type'] =='heading'):
-            # get simple token list for paragraph
-            para_tokens = str(para['content']).split()
-            # check for upper threshold
-            if len(para_tokens) < upper_threshold:
-                # check for lower threshold
-                if len(para_tokens) > lower_threshold:
-                    # all good just append the para in new list
-                    new_paragraphs.append(para)
-                # if the token count is less than lower threshold
-                # then just append it to previous paragraph
-                else:
-                    if len(new_paragraphs)>0:
-                        # only merge if previous element is also 'paragraph'
-                        if (new_paragraphs[-1]['metadata']['type'] =='paragraph') or (new_paragraphs[-1]['metadata']['type'] =='heading'):
-                            # append the content and headings
-                            new_paragraphs[-1]['content'] = new_paragraphs[-1]['content'] + " \n" + para['content']
-                            new_paragraphs[-1]['metadata']['headings'].append(para['metadata']['headings'])
-                        # if previous element is not paragraph type then just append to new paragraphs list
-                        else:
-                            new_paragraphs.append(para)
-                    else:
-                        new_paragraphs.append(para)
-            # if upper threshold value is not respected then split it iteratively
-            else:
-                while len(para_tokens) > upper_threshold:
-                    new_paragraphs.append({'content':" ".join(para_tokens[:upper_threshold]), 
-                                           'metadata':para['metadata']})
-                    para_tokens = para_tokens[upper_threshold:]
         # if element type is not 'paragraph' then just append without santization
+        if not _is_text(para):
+            if last_count is not None:
+                _split_last(new_paragraphs, last_count, upper_threshold)
+            new_paragraphs.append(para)
+            last_count = None
+            continue
+
+        # get simple token count for paragraph
+        token_count = len(str(para['content']).split())
+        # if the token count is less than lower threshold then just append it to previous
+        # paragraph, only if previous element is also 'paragraph'
+        if token_count <= lower_threshold and last_count is not None:
+            if not last_copied:
+                # input paragraphs are not modified
+                last = new_paragraphs[-1]
+                new_paragraphs[-1] = {**last, 'metadata':{**last['metadata'],
+                                                  'headings':list(last['metadata']['headings'])}}
+                last_copied = True
+            # append the content and headings
+            new_paragraphs[-1]['content'] = new_paragraphs[-1]['content'] + " \n" + para['content']
+            new_paragraphs[-1]['metadata']['headings'].extend(para['metadata']['headings'])
+            last_count += token_count
         else:
+            # previous paragraph is complete, check for upper threshold
+            if last_count is not None:
+                _split_last(new_paragraphs, last_count, upper_threshold)
             new_paragraphs.append(para)
-        
+            last_count = token_count
+            last_copied = False
+
+    if last_count is not None:
+        _split_last(new_paragraphs, last_count, upper_threshold)
+
     return new_paragraphs
 
 def table_sanitize(paragraphs,token_limit = 400):
@@ -225,13 +249,9 @@ def simplejson_splitter(json_filepath, headings_level, filename, page_start = 0,
 
     logging.info(f"Paragraphs count in {filename}:{len(paragraphs)}")
     
-    # Running paragraph sanitization in terms of token count, iteratively 
-    paragraphs_count_check= False
-    while paragraphs_count_check == False:
-        para_counts = len(paragraphs)
-        paragraphs = paragraph_sanitize(paragraphs=paragraphs,lower_threshold=lower_threshold,
+    # Running paragraph sanitization in terms of token count, single pass gives final result
+    paragraphs = paragraph_sanitize(paragraphs=paragraphs,lower_threshold=lower_threshold,
                                     upper_threshold=upper_threshold)
-        paragraphs_count_check = len(paragraphs) == para_counts
 
     logging.info(f"Paragraphs count in {filename} after sanitization:{len(paragraphs)}")
     
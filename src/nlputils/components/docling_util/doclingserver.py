@@ -14,22 +14,116 @@ from docling.datamodel.pipeline_options import (
     TesseractOcrOptions,
 )
 from docling.datamodel.base_models import InputFormat
+from docling.utils.utils import create_file_hash
+from docling.exceptions import ConversionError
 from docling_core.types import DoclingDocument
+import fitz
 import logging
 import os
+import re
+import mimetypes
+import pickle
 import json
+import tempfile
+import threading
 import pandas as pd
 from pathlib import Path
+from types import SimpleNamespace
 from typing import Iterable
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 import yaml
+from nlputils.utils import write_jsonl, get_page_count
 
 
-def send_doc(file_path:str):
+# process wide registry of document converters keyed by pipeline options, so the layout,
+# table and OCR models are loaded once per process
+_CONVERTERS = {}
+_CONVERTERS_LOCK = threading.Lock()
+# registry of hybrid chunkers keyed by (embed_model_id, max_tokens), tokenizer is loaded once
+_CHUNKERS = {}
+_CHUNKERS_LOCK = threading.Lock()
+
+
+def get_pipeline_options(num_threads=8, ocr=False)->PdfPipelineOptions:
+    """
+    returns the pipeline options used by batch_processing (ocr=False) and useOCR (ocr=True)
+
+    Params
+    ---------------------
+    - num_threads: number of threads/logical-processors in CPU to be used
+    - ocr: if True full page OCR (EasyOCR) is forced, to be used for imagepdf
+    """
+    # device to be used, if GPU then will be used
+    accelerator_options = AcceleratorOptions(
+        num_threads=num_threads, device=AcceleratorDevice.AUTO
+    )
+    if ocr:
+        # Set lang=["auto"] with a tesseract OCR engine: TesseractOcrOptions, TesseractCliOcrOptions
+        #ocr_options = TesseractOcrOptions(lang=["auto"])
+        #ocr_options = TesseractCliOcrOptions(lang=["auto"])
+        ocr_options = EasyOcrOptions(force_full_page_ocr=True)
+
+        # declare the pipieline for OCR with OCR options
+        pipeline_options = PdfPipelineOptions(
+            do_ocr=True, force_full_page_ocr=True, ocr_options=ocr_options
+        )
+    else:
+        # declaring the pipeline 
+        pipeline_options = PdfPipelineOptions()
+        # if image then perform ocr
+        pipeline_options.do_ocr = True
+        # to extract or not to extaract the table structural info 
+        pipeline_options.do_table_structure = True
+        pipeline_options.table_structure_options.do_cell_matching = True
+    # adding the device accelration info
+    pipeline_options.accelerator_options = accelerator_options
+    return pipeline_options
+
+
+def get_converter(pipeline_options:PdfPipelineOptions=None)->DocumentConverter:
+    """
+    returns the DocumentConverter for pipeline_options, converter is created once per process
+    and reused for later calls with same options (pipeline_options None means docling defaults)
+    """
+    key = "default" if pipeline_options is None else pipeline_options.model_dump_json()
+    with _CONVERTERS_LOCK:
+        if key not in _CONVERTERS:
+            if pipeline_options is None:
+                _CONVERTERS[key] = DocumentConverter()
+            else:
+                _CONVERTERS[key] = DocumentConverter(
+                    format_options={
+                        InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options)
+                    }
+                )
+        return _CONVERTERS[key]
+
+
+def warm_up(pipeline_options:PdfPipelineOptions=None)->DocumentConverter:
+    """
+    creates the converter for pipeline_options and loads the pdf pipeline models, call this
+    at the start of service so that first document does not pay the model loading time
+
+    Usage
+    -------------
+        warm_up()                                             # for send_doc
+        warm_up(get_pipeline_options(num_threads=8))          # for batch_processing
+        warm_up(get_pipeline_options(num_threads=8, ocr=True))# for useOCR
+    """
+    converter = get_converter(pipeline_options)
+    converter.initialize_pipeline(InputFormat.PDF)
+    return converter
+
+
+def send_doc(file_path:str, pipeline_options:PdfPipelineOptions=None):
     """ this is to process single file and get the doclingDocument
 
     Params
     -----------------
     - file_path: the path to file
+    - pipeline_options: pipeline options of converter, default is docling defaults. The 
+                converter is reused across calls (see get_converter)
     
     Returns
     ------------------
@@ -39,7 +133,7 @@ def send_doc(file_path:str):
       """
     try:
         source = file_path
-        converter = DocumentConverter()
+        converter = get_converter(pipeline_options)
         result = converter.convert(source)
     except Exception as e:
         logging.warning(e)
@@ -50,7 +144,61 @@ def send_doc(file_path:str):
 
     return result, filename
 
-def get_tables(doclingDoc:DoclingDocument, folder_location:str, filename:str):
+# formats which can be exported by save_output, tables are saved as one file per table
+EXPORT_FORMATS = ('json', 'text', 'markdown', 'doctags', 'tables_csv', 'tables_html')
+
+
+def _iter_json(obj, depth=3):
+    """
+    yields the json encoding of obj in pieces, same output as json.dumps(obj). Containers up to
+    depth are walked here and the nested values are encoded by C encoder, so the document is
+    never held as one string
+    """
+    if depth > 0 and isinstance(obj, dict) and obj:
+        yield "{"
+        for i, (key, value) in enumerate(obj.items()):
+            yield (", " if i else "") + json.dumps(str(key)) + ": "
+            yield from _iter_json(value, depth - 1)
+        yield "}"
+    elif depth > 0 and isinstance(obj, list) and obj:
+        yield "["
+        for i, value in enumerate(obj):
+            if i:
+                yield ", "
+            yield from _iter_json(value, depth - 1)
+        yield "]"
+    else:
+        yield json.dumps(obj)
+
+
+def _export_json(document, save_to_folder, filename):
+    """ streams the lossless json of docling.Document to file"""
+    with (save_to_folder / f"{filename}.json").open("w", encoding="utf-8") as fp:
+        fp.writelines(_iter_json(document.export_to_dict()))
+
+
+def _export_text(document, save_to_folder, filename):
+    with (save_to_folder / f"{filename}.txt").open("w", encoding="utf-8") as fp:
+        fp.write(document.export_to_text())
+
+
+def _export_markdown(document, save_to_folder, filename):
+    with (save_to_folder / f"{filename}.md").open("w", encoding="utf-8") as fp:
+        fp.write(document.export_to_markdown())
+
+
+def _export_doctags(document, save_to_folder, filename):
+    # Document Tags format: this gives a document structure info
+    with (save_to_folder / f"{filename}.doctags").open("w", encoding="utf-8") as fp:
+        fp.write(document.export_to_document_tokens())
+
+
+_EXPORTERS = {'json': _export_json, 'text': _export_text, 'markdown': _export_markdown,
+              'doctags': _export_doctags}
+
+
+def get_tables(doclingDoc:DoclingDocument, folder_location:str, filename:str,
+               table_formats=('csv', 'html')):
     """use the putput from send_doc(Docling.Document) and then fetch the tables
       from it
       
@@ -63,6 +211,7 @@ def get_tables(doclingDoc:DoclingDocument, folder_location:str, filename:str):
                         Ex: pass folder location as "../folder1/", the output will be saved
                           automatically to "../folder1/filename/tables/"
     - filename
+    - table_formats: formats in which each table is saved, 'csv' and/or 'html'
 
 
     Returns
@@ -80,25 +229,26 @@ def get_tables(doclingDoc:DoclingDocument, folder_location:str, filename:str):
 
     # Export tables
     for table_ix, table in enumerate(doclingDoc.document.tables):
-        table_df: pd.DataFrame = table.export_to_dataframe()
-
         # Save the table as csv
-        try:
-            element_csv_filename = save_to_folder / f"{table_ix+1}.csv"
-            table_df.to_csv(element_csv_filename)
-        except Exception as e:
-            logging.error(e)
+        if 'csv' in table_formats:
+            try:
+                table_df: pd.DataFrame = table.export_to_dataframe()
+                element_csv_filename = save_to_folder / f"{table_ix+1}.csv"
+                table_df.to_csv(element_csv_filename)
+            except Exception as e:
+                logging.error(e)
         # Save the table as html
-        try:
-            element_html_filename = save_to_folder / f"{table_ix+1}.html"
-            with element_html_filename.open("w", encoding="utf-8") as fp:
-                fp.write(table.export_to_html())
-        except Exception as e:
-            logging.error(e)
+        if 'html' in table_formats:
+            try:
+                element_html_filename = save_to_folder / f"{table_ix+1}.html"
+                with element_html_filename.open("w", encoding="utf-8") as fp:
+                    fp.write(table.export_to_html())
+            except Exception as e:
+                logging.error(e)
 
     return save_to_folder
 
-def save_output(doclingDoc, folder_location, filename):
+def save_output(doclingDoc, folder_location, filename, export_formats=None, max_workers=None):
     """ use Docling.Document all the outputs including markdown, text,tables etc
     
      Params
@@ -109,55 +259,55 @@ def save_output(doclingDoc, folder_location, filename):
                         Ex: pass folder location as "../folder1/", but output will be saved
                          to "../folder1/filename/"
      - filename
+     - export_formats: formats to be saved, subset of EXPORT_FORMATS, default is all.
+                        Ex: ['json', 'markdown'] for the docling json and markdown only
+     - max_workers: number of threads running the exporters concurrently, default is one
+                        per format
 
 
      Returns
      ---------------------------
      - save_to_folder: Folder where all the outputs are saved for a file
-     - tables_path: tables folder which is sub-dir in save_to_folder
+     - tables_path: tables folder which is sub-dir in save_to_folder, None if tables 
+                    are not exported
      """
+    export_formats = list(EXPORT_FORMATS if export_formats is None else export_formats)
+    unknown = set(export_formats) - set(EXPORT_FORMATS)
+    if unknown:
+        raise ValueError(f"Unknown export formats {sorted(unknown)}, allowed are {EXPORT_FORMATS}")
+
     save_to_folder = Path(folder_location + filename)
     try:
         save_to_folder.mkdir(parents=True, exist_ok=True)
     except Exception as e:
         logging.warning(e)
 
-    # save the tables
-    tables_path = get_tables(doclingDoc=doclingDoc,folder_location=folder_location,
-                             filename=filename)
-    try:
-        # Export Docling Json
-        with (save_to_folder / f"{filename}.json").open("w", encoding="utf-8") as fp:
-            fp.write(json.dumps(doclingDoc.document.export_to_dict()))
-    except Exception as e:
-        logging.info(e)
-
-    # Export Text format:
-    try:
-        with (save_to_folder / f"{filename}.txt").open("w", encoding="utf-8") as fp:
-            fp.write(doclingDoc.document.export_to_text())
-    except Exception as e:
-        logging.info(e)
-
-    # Export Markdown format:
-    try:
-        with (save_to_folder / f"{filename}.md").open("w", encoding="utf-8") as fp:
-            fp.write(doclingDoc.document.export_to_markdown())
-    except Exception as e:
-        logging.info(e)
-
-    # Export Document Tags format: this gives a document structure info
-    try:
-        with (save_to_folder / f"{filename}.doctags").open("w", encoding="utf-8") as fp:
-            fp.write(doclingDoc.document.export_to_document_tokens())
-    except Exception as e:
-        logging.info(e)
-
+    # each exporter walks the document independently, so they are run concurrently
+    table_formats = [f.split('_')[1] for f in export_formats if f.startswith('tables_')]
+    tasks = {}
+    with ThreadPoolExecutor(max_workers=max_workers or max(1, len(export_formats))) as executor:
+        if table_formats:
+            tasks['tables'] = executor.submit(get_tables, doclingDoc=doclingDoc,
+                                              folder_location=folder_location, filename=filename,
+                                              table_formats=table_formats)
+        for export_format in export_formats:
+            if export_format in _EXPORTERS:
+                tasks[export_format] = executor.submit(_EXPORTERS[export_format],
+                                                       doclingDoc.document, save_to_folder, filename)
+
+    tables_path = None
+    for export_format, task in tasks.items():
+        try:
+            result = task.result()
+            if export_format == 'tables':
+                tables_path = result
+        except Exception as e:
+            logging.info(e)
 
     return save_to_folder, tables_path
 
 def export_documents(
-    conv_results: Iterable[ConversionResult],output_dir:str,
+    conv_results: Iterable[ConversionResult],output_dir:str, export_formats=None,
 ):
     """ uses the iterable output from docling for mutliple docs and save the output for 
     all the documents 
@@ -168,6 +318,7 @@ def export_documents(
     - output_dir: the parent folder where output for ech file willbe saved
                 Ex: if output_dir = "../folder1/' the putputs for file are saved to 
                 '../folder1/filename1/', '../folder1/filename2/' etc
+    - export_formats: formats saved for each document, check save_output
         
     Returns
     --------------------------
@@ -193,7 +344,7 @@ def export_documents(
 
             # save the output from for particular doc
             a,b = save_output(doclingDoc=conv_res,folder_location=output_dir,
-                        filename=doc_filename)
+                        filename=doc_filename, export_formats=export_formats)
             folder_info.append(a)
 
         elif conv_res.status == ConversionStatus.PARTIAL_SUCCESS:
@@ -214,7 +365,250 @@ def export_documents(
     )
     return success_count, partial_success_count, failure_count, folder_info
 
-def batch_processing(file_list:list, output_dir:str, num_threads=8):
+def _init_worker(pipeline_options):
+    """ creates and warms up the converter of worker process"""
+    try:
+        warm_up(pipeline_options)
+    except Exception as e:
+        # conversion in worker will report the error for each file
+        logging.error(e)
+
+
+def _convert_in_worker(file_path, pipeline_options):
+    """ converts the file in worker process, returns (status, error messages, DoclingDocument)"""
+    try:
+        conv_res = get_converter(pipeline_options).convert(file_path, raises_on_error=False)
+        return conv_res.status, [item.error_message for item in conv_res.errors], conv_res.document
+    except Exception as e:
+        return ConversionStatus.FAILURE, [str(e)], None
+
+
+def _conversion_result(file_path, status, errors, document):
+    """ light weight stand-in of ConversionResult with the attributes used by export_documents"""
+    return SimpleNamespace(status=status, input=SimpleNamespace(file=Path(file_path)),
+                           errors=[SimpleNamespace(error_message=error) for error in errors],
+                           document=document)
+
+
+def _file_cost(file_path):
+    """ estimated cost of converting file, page count for pdf else file size in 100KB"""
+    page_count = get_page_count(file_path) if file_path.lower().endswith('.pdf') else None
+    if page_count is not None:
+        return page_count
+    try:
+        return os.path.getsize(file_path) / 1e5
+    except OSError:
+        return 0
+
+
+def _run_pool(file_list, pipeline_options, workers, max_in_flight, crashed):
+    """
+    converts files in process pool with at most max_in_flight files submitted, yields the
+    results as they complete. If a worker process dies the pool is re-created and the files
+    which were in flight are added to crashed instead of aborting the batch
+    """
+    pending = list(file_list)
+    while pending:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(pipeline_options,)) as executor:
+            in_flight = {}
+            broken = False
+            while (pending or in_flight) and not broken:
+                while pending and len(in_flight) < max_in_flight:
+                    file = pending.pop(0)
+                    in_flight[executor.submit(_convert_in_worker, file, pipeline_options)] = file
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file = in_flight.pop(future)
+                    try:
+                        yield _conversion_result(file, *future.result())
+                    except BrokenProcessPool:
+                        broken = True
+                        crashed.append(file)
+            if broken:
+                # every file in flight when the worker died is a suspect
+                crashed.extend(in_flight.values())
+                logging.warning(f"worker process crashed, restarting the pool, suspects: {crashed}")
+
+
+_REF_PATTERN = re.compile(r"^#/(\w+)/(\d+)$")
+
+
+def _shift_document(doc_dict, counts, page_offset):
+    """
+    shifts the references (ex: '#/texts/5') of items in exported DoclingDocument by counts of
+    items in each collection and the page numbers by page_offset, changes doc_dict in place
+    """
+    def shift_ref(match):
+        return f"#/{match.group(1)}/{int(match.group(2)) + counts.get(match.group(1), 0)}"
+
+    def shift(obj):
+        if isinstance(obj, dict):
+            for key, value in obj.items():
+                if key in ("$ref", "self_ref") and isinstance(value, str):
+                    obj[key] = _REF_PATTERN.sub(shift_ref, value)
+                elif key == "prov" and isinstance(value, list):
+                    for prov in value:
+                        prov["page_no"] += page_offset
+                else:
+                    shift(value)
+        elif isinstance(obj, list):
+            for item in obj:
+                shift(item)
+
+    pages = doc_dict.pop("pages", {})
+    shift(doc_dict)
+    doc_dict["pages"] = {}
+    for page in pages.values():
+        page["page_no"] += page_offset
+        doc_dict["pages"][str(page["page_no"])] = page
+    return doc_dict
+
+
+def merge_documents(documents:list, page_offsets:list, name:str=None, file_path:str=None)->DoclingDocument:
+    """
+    merges the DoclingDocuments of page ranges (shards) of a file into one document, the page
+    numbers of items are shifted by page offset of the shard so they match the original file
+
+    Params
+    ----------------------
+    - documents: list of DoclingDocument in page order
+    - page_offsets: number of pages before each shard in the original file
+    - name: name of merged document, default is name of first document
+    - file_path: original file of shards, the origin (filename, mimetype, hash) of merged 
+                document is set from it, default is origin of first shard
+    """
+    merged = _shift_document(documents[0].export_to_dict(), {}, page_offsets[0])
+    for document, page_offset in zip(documents[1:], page_offsets[1:]):
+        # items of shard are appended after the items already merged
+        counts = {key: len(value) for key, value in merged.items() if isinstance(value, list)}
+        doc_dict = _shift_document(document.export_to_dict(), counts, page_offset)
+        for key in counts:
+            merged[key].extend(doc_dict.get(key, []))
+        for root in ("body", "furniture"):
+            if root in doc_dict:
+                merged[root]["children"].extend(doc_dict[root].get("children", []))
+        merged["pages"].update(doc_dict["pages"])
+    if name is not None:
+        merged["name"] = name
+    if file_path is not None:
+        # same origin as docling gives for the original file, not the temporary shard
+        merged["origin"] = {'mimetype': mimetypes.guess_type(file_path)[0] or "application/pdf",
+                            'binary_hash': create_file_hash(Path(file_path)),
+                            'filename': Path(file_path).name}
+    return DoclingDocument.model_validate(merged)
+
+
+def _split_pdf(file_path, shard_pages, tmp_dir):
+    """
+    splits the pdf in page ranges of shard_pages pages saved in tmp_dir, returns list of
+    (shard path, page offset)
+    """
+    shards = []
+    stem = Path(file_path).stem
+    with fitz.open(file_path) as doc:
+        for start in range(0, len(doc), shard_pages):
+            end = min(start + shard_pages, len(doc))
+            shard_path = os.path.join(tmp_dir, f"{stem}.pages_{start + 1}-{end}.pdf")
+            with fitz.open() as shard:
+                shard.insert_pdf(doc, from_page=start, to_page=end - 1)
+                shard.save(shard_path)
+            shards.append((shard_path, start))
+    return shards
+
+
+def _merge_shards(file_path, results, page_offsets):
+    """ merges the conversion results of shards of file into one conversion result"""
+    errors = [item.error_message for result in results for item in result.errors]
+    if any(result.document is None or result.status == ConversionStatus.FAILURE for result in results):
+        return _conversion_result(file_path, ConversionStatus.FAILURE, errors, None)
+    status = ConversionStatus.SUCCESS
+    if any(result.status != ConversionStatus.SUCCESS for result in results):
+        status = ConversionStatus.PARTIAL_SUCCESS
+    try:
+        document = merge_documents([result.document for result in results], page_offsets,
+                                   name=Path(file_path).stem, file_path=file_path)
+    except Exception as e:
+        logging.error(e)
+        return _conversion_result(file_path, ConversionStatus.FAILURE, errors + [str(e)], None)
+    return _conversion_result(file_path, status, errors, document)
+
+
+def _convert_files(file_list, pipeline_options, workers):
+    """ converts the files in process pool largest first, see convert_parallel"""
+    file_list = sorted(file_list, key=_file_cost, reverse=True)
+    suspects = []
+    yield from _run_pool(file_list, pipeline_options, workers, workers, suspects)
+    crashed = []
+    yield from _run_pool(suspects, pipeline_options, 1, 1, crashed)
+    for file in crashed:
+        yield _conversion_result(file, ConversionStatus.FAILURE, ["worker process crashed"], None)
+
+
+def convert_parallel(file_list:list, pipeline_options:PdfPipelineOptions, workers:int=2,
+                     shard_pages:int=None):
+    """
+    converts the files in process pool where each worker holds its own warmed up converter.
+    Files are dispatched largest first (page count) and results are yielded as they complete, 
+    so it can be passed directly to export_documents. A crash of worker process does not abort
+    the batch, the files in flight are retried one at a time and the file crashing the worker
+    again is reported as failed.
+
+    Params
+    -----------------------
+    - file_list: the list of file-paths
+    - pipeline_options: pipeline options of converter in each worker
+    - workers: number of processes
+    - shard_pages: pdfs with more pages are split into page ranges of shard_pages pages which
+                are converted in parallel and merged back into one document (page numbers
+                are same as in original file). Default None means no splitting
+
+    Returns
+    ------------------------
+    - generator of conversion results (status, input.file, errors, document)
+    """
+    if shard_pages is None:
+        yield from _convert_files(file_list, pipeline_options, workers)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tasks = []
+        # shard path -> (original file, shard index), original file -> page offsets of shards
+        shard_of = {}
+        offsets = {}
+        for file in file_list:
+            page_count = get_page_count(file) if file.lower().endswith('.pdf') else None
+            if page_count is None or page_count <= shard_pages:
+                tasks.append(file)
+                continue
+            try:
+                shards = _split_pdf(file, shard_pages, tmp_dir)
+            except Exception as e:
+                logging.error(e)
+                tasks.append(file)
+                continue
+            offsets[file] = [offset for _, offset in shards]
+            for index, (shard_path, _) in enumerate(shards):
+                shard_of[shard_path] = (file, index)
+                tasks.append(shard_path)
+
+        shard_results = {}
+        for result in _convert_files(tasks, pipeline_options, workers):
+            shard_path = str(result.input.file)
+            if shard_path not in shard_of:
+                yield result
+                continue
+            file, index = shard_of[shard_path]
+            shard_results.setdefault(file, {})[index] = result
+            # merge once all shards of file are converted
+            if len(shard_results[file]) == len(offsets[file]):
+                results = [shard_results[file][i] for i in range(len(offsets[file]))]
+                yield _merge_shards(file, results, offsets[file])
+                del shard_results[file]
+
+
+def batch_processing(file_list:list, output_dir:str, num_threads=8, cache=None, workers=1, shard_pages=None,
+                     export_formats=None):
     """
     take the file list and processes and saves the outputs of each file, recommended to use
     for docx and normal pdf. For imagepdf use 'useOCR'
@@ -225,10 +619,19 @@ def batch_processing(file_list:list, output_dir:str, num_threads=8):
     - outout_dir: the folder location to save the output for the whole batch
                 Ex: if output_dir = "../folder1/' the putputs for file are saved to 
                 '../folder1/filename1/', '../folder1/filename2/' etc
-    - num_threads: Docling.Document cannot parallelize the document processing but you can 
-                    tell how many threads/logical-processors in CPU can be used, higher the
+    - num_threads: how many threads/logical-processors in CPU can be used, higher the
                     number better the CPU utilization (but limits the usage of machine for
-                     other tasks)
+                     other tasks). Within one converter docling processes the documents 
+                     sequentially, use workers to process documents in parallel
+    - cache: nlputils.cache.ResultCache, if passed the outputs of files already processed 
+                with same pipeline options are restored from cache to output_dir instead 
+                of being processed again (restored files are counted as success)
+    - workers: if more than 1 the documents are processed in parallel by processes each with 
+                its own converter (see convert_parallel), num_threads are divided among workers
+    - shard_pages: used with workers, pdfs with more pages are split into page ranges which are
+                processed in parallel and merged back. Sharding is opt-in, default None (or 
+                workers=1) converts each pdf whole
+    - export_formats: formats saved for each file, subset of EXPORT_FORMATS, default is all
         
     Returns
     -------------------
@@ -237,38 +640,58 @@ def batch_processing(file_list:list, output_dir:str, num_threads=8):
     """
     logging.basicConfig(level=logging.INFO)
     """batch processing of multiple docs"""
-    # device to be used, if GPU then will be used
-    accelerator_options = AcceleratorOptions(
-        num_threads=num_threads, device=AcceleratorDevice.AUTO
-    )
-    # declaring the pipeline 
-    pipeline_options = PdfPipelineOptions()
-    # adding the device accelration info
-    pipeline_options.accelerator_options = accelerator_options
-    # if image then perform ocr
-    pipeline_options.do_ocr = True
-    # to extract or not to extaract the table structural info 
-    pipeline_options.do_table_structure = True
-    pipeline_options.table_structure_options.do_cell_matching = True
-
-    # create document convertor
-    doc_converter = DocumentConverter(
-        format_options={
-            InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options)
-        }
-    )
+    pipeline_options = get_pipeline_options(num_threads=num_threads)
+
+    # restore the files already processed from cache
+    cached_info = []
+    cache_keys = {}
+    if cache is not None:
+        # outputs with other export formats are cached separately
+        cache_config = pipeline_options
+        if export_formats is not None:
+            cache_config = {'pipeline_options': pipeline_options.model_dump_json(),
+                            'export_formats': sorted(export_formats)}
+        pending = []
+        for file in file_list:
+            key = cache.make_key(file, processor='docling', config=cache_config)
+            filename = Path(file).stem
+            path = cache.get(key, restore_to=output_dir + filename)
+            if path is None:
+                pending.append(file)
+                cache_keys[filename] = key
+            else:
+                cached_info.append(Path(path))
+        logging.info(f"{len(cached_info)} files restored from cache, {len(pending)} files to be processed")
+        file_list = pending
+
+    if workers > 1:
+        # threads are divided among the workers
+        worker_options = pipeline_options.model_copy(deep=True)
+        worker_options.accelerator_options.num_threads = max(1, num_threads // workers)
+        conv_results = convert_parallel(file_list, worker_options, workers=workers, shard_pages=shard_pages)
+    else:
+        # document convertor, reused across batches
+        doc_converter = get_converter(pipeline_options)
 
-    # process all docs, creates the iterable
-    conv_results = doc_converter.convert_all(
-        file_list,
-        raises_on_error=False,  # to let conversion run through all and examine results at the end
-    )
+        # process all docs, creates the iterable
+        conv_results = doc_converter.convert_all(
+            file_list,
+            raises_on_error=False,  # to let conversion run through all and examine results at the end
+        )
 
     # calling Export_documents 
     success_count, partial_success_count, failure_count, folder_info = export_documents(
-        conv_results, output_dir
+        conv_results, output_dir, export_formats=export_formats
     )
 
+    # add the newly processed files to cache
+    if cache is not None:
+        for folder in folder_info:
+            if folder.name in cache_keys:
+                cache.put(cache_keys[folder.name], str(folder))
+        success_count += len(cached_info)
+        folder_info = cached_info + folder_info
+
     if failure_count > 0:
         raise RuntimeError(
             f"The example failed converting {failure_count} on {len(file_list)}."
@@ -277,7 +700,7 @@ def batch_processing(file_list:list, output_dir:str, num_threads=8):
     return success_count, partial_success_count, failure_count, folder_info
 
 
-def useOCR(file_path, num_threads=8):
+def useOCR(file_path, num_threads=8, workers=1, shard_pages=None):
     """
     this is specifically to be used for image pdfs, however for imagepdfs its good to do 
     the iteration one at a time
@@ -289,6 +712,12 @@ def useOCR(file_path, num_threads=8):
                     tell how many threads/logical-processors in CPU can be used, higher the
                     number better the CPU utilization (but limits the usage of machine for
                      other tasks)
+    - workers: used with shard_pages, number of processes converting the page ranges in parallel,
+                num_threads are divided among workers
+    - shard_pages: if file has more pages, it is split into page ranges of shard_pages pages
+                which are OCRed in parallel and merged back into one document. Sharding is 
+                opt-in, default None (or workers=1) OCRs the file whole. Same as for
+                unsharded file ConversionError is raised if conversion fails
 
 
     Returns
@@ -299,41 +728,147 @@ def useOCR(file_path, num_threads=8):
     """
     
     input_doc = Path(file_path)
-    # device to be used, if GPU then will be used
-    accelerator_options = AcceleratorOptions(
-        num_threads=num_threads,device=AcceleratorDevice.AUTO
-    )
-
+    pipeline_options = get_pipeline_options(num_threads=num_threads, ocr=True)
+    # extract filename
+    filename = os.path.splitext(os.path.basename(file_path))[0]
 
-    # Set lang=["auto"] with a tesseract OCR engine: TesseractOcrOptions, TesseractCliOcrOptions
-    #ocr_options = TesseractOcrOptions(lang=["auto"])
-    #ocr_options = TesseractCliOcrOptions(lang=["auto"])
-    ocr_options = EasyOcrOptions(force_full_page_ocr=True)
+    if workers > 1 and shard_pages is not None:
+        pipeline_options.accelerator_options.num_threads = max(1, num_threads // workers)
+        result = next(convert_parallel([file_path], pipeline_options, workers=workers,
+                                       shard_pages=shard_pages))
+        # fail same as converter.convert does for unsharded file
+        if result.status == ConversionStatus.FAILURE:
+            raise ConversionError(f"Conversion failed for: {file_path} with errors: "
+                                  f"{[item.error_message for item in result.errors]}")
+        return result, filename
 
-    # declare the pipieline for OCR with OCR options
-    pipeline_options = PdfPipelineOptions(
-        do_ocr=True, force_full_page_ocr=True, ocr_options=ocr_options
-    )
-    # update the accelarotor options for OCR, use GPU
-    pipeline_options.accelerator_options = accelerator_options
+    # convertor with OCR options, reused across calls
+    converter = get_converter(pipeline_options)
 
-    # define the convertor
-    converter = DocumentConverter(
-        format_options={
-            InputFormat.PDF: PdfFormatOption(
-                pipeline_options=pipeline_options,
-            )
-        }
-    )
-    
     # convert doc
     result = converter.convert(input_doc)
-    # extract filename
-    filename = os.path.splitext(os.path.basename(file_path))[0]
 
     return result, filename
 
-def hybrid_chunking(folder_location,embed_model_id, max_tokens= None):
+def _json_signature(doc_path):
+    """ (mtime, size) of docling json, the binary copy is valid only for same signature"""
+    stat = os.stat(doc_path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _save_binary(doc, doc_path, signature):
+    """ pickles the validated docling.Document next to its json as filename.pkl"""
+    binary_path = os.path.splitext(doc_path)[0] + ".pkl"
+    file = None
+    try:
+        # unique tmp file, concurrent saves of same document do not write into each other
+        with tempfile.NamedTemporaryFile('wb', dir=os.path.dirname(binary_path) or ".", suffix=".tmp",
+                                         delete=False) as file:
+            pickle.dump((signature, doc), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(file.name, binary_path)
+    except Exception as e:
+        logging.warning(e)
+        if file is not None and os.path.exists(file.name):
+            os.remove(file.name)
+
+
+def _load_binary(doc_path, signature):
+    """ returns the pickled docling.Document if it is up to date with json, else None"""
+    binary_path = os.path.splitext(doc_path)[0] + ".pkl"
+    if not os.path.isfile(binary_path):
+        return None
+    try:
+        with open(binary_path, 'rb') as file:
+            binary_signature, doc = pickle.load(file)
+    except Exception as e:
+        logging.warning(e)
+        return None
+    if binary_signature != signature or not isinstance(doc, DoclingDocument):
+        return None
+    return doc
+
+
+def _load_document(folder_location, use_binary=True):
+    """
+    returns the docling.Document saved in folder_location or None if corrupt. The validated
+    document is also saved in binary form (filename.pkl) which is loaded instead of json in
+    later calls as long as the json is not modified (mtime and size)
+    """
+    # extracting filename
+    filename = os.path.basename(folder_location)
+
+    # definign path for docling.Document within folder
+    doc_path = folder_location + "/" + filename + ".json"
+    # read file
+    try:
+        signature = _json_signature(doc_path)
+        if use_binary:
+            doc = _load_binary(doc_path, signature)
+            if doc is not None:
+                return doc
+        with Path(doc_path).open("r", encoding="utf-8") as fp:
+            doc_dict = json.load(fp)
+        doc = DoclingDocument.model_validate(doc_dict)
+    except Exception as e:
+        logging.error("corrupt")
+        return None
+    if use_binary:
+        _save_binary(doc, doc_path, signature)
+    return doc
+
+
+def _as_document(document):
+    """ returns the DoclingDocument of ConversionResult (send_doc/batch_processing output)"""
+    return getattr(document, 'document', document)
+
+
+def _get_chunker(embed_model_id, max_tokens=None):
+    """
+    returns the HybridChunker using tokenizer of embed_model_id, chunker is created once per
+    process for (embed_model_id, max_tokens) and reused for later calls
+    """
+    key = (embed_model_id, max_tokens)
+    with _CHUNKERS_LOCK:
+        if key not in _CHUNKERS:
+            if max_tokens is None:
+                _CHUNKERS[key] = HybridChunker(tokenizer=embed_model_id)
+            else:
+                _CHUNKERS[key] = HybridChunker(tokenizer=embed_model_id, max_tokens=max_tokens)
+        return _CHUNKERS[key]
+
+
+def _iter_doc_chunks(doc, chunker, filename):
+    """ yields the chunks of doc with metadata info"""
+    for chunk in chunker.chunk(doc):
+        yield {'content':chunker.serialize(chunk=chunk),
+               'metadata':{'filename':filename,
+                           'page':chunk.meta.doc_items[0].prov[0].page_no}}
+
+
+def iter_hybrid_chunks(folder_location,embed_model_id, max_tokens= None, document=None):
+    """
+    generator version of hybrid_chunking, chunks are serialized and yielded lazily as the
+    chunker produces them. Use with nlputils.utils.write_jsonl to stream the chunks to disk.
+
+    Params
+    --------------------
+    same as hybrid_chunking
+
+    Returns
+    -------------
+    - generator of chunks where each chunk is dictionary {'content':actual content,
+    'metadata': dictionary with info on page and filename}
+
+    """
+    doc = _load_document(folder_location) if document is None else _as_document(document)
+    if doc is None:
+        return
+    chunker = _get_chunker(embed_model_id, max_tokens)
+    yield from _iter_doc_chunks(doc, chunker, os.path.basename(folder_location))
+
+
+def hybrid_chunking(folder_location,embed_model_id, max_tokens= None, output_format='json',
+                    document=None):
     """
     this is adaptation of hybrid chunking (headings) imlemented for docling.Document
 
@@ -345,6 +880,12 @@ def hybrid_chunking(folder_location,embed_model_id, max_tokens= None):
                         model will be used to do the chunking)
     - max_tokens: while the max_token info can be fetched from model id but you can set the 
                     token limit for chunking too
+    - output_format: 'json' saves {'paragraphs':[...]} to chunks.json, 'jsonl' streams 
+                    the chunks one per line to chunks.jsonl without holding all in memory
+    - document: DoclingDocument (or the result of send_doc/batch_processing) to be chunked
+                    directly instead of loading it from folder_location, chunks are still
+                    saved to folder_location. When loaded from folder, the validated document
+                    is kept as filename.pkl next to json so re-chunking skips json validation
     
                     
     Returns
@@ -352,41 +893,120 @@ def hybrid_chunking(folder_location,embed_model_id, max_tokens= None):
     - location to the chunks file
     
     """
+    doc = _load_document(folder_location) if document is None else _as_document(document)
+    if doc is None:
+        return None
+    chunker = _get_chunker(embed_model_id, max_tokens)
+    chunk_iter = _iter_doc_chunks(doc, chunker, os.path.basename(folder_location))
+    return _save_chunks(chunk_iter, folder_location, output_format)
 
-    # extracting filename
-    filename = os.path.basename(folder_location)
 
-    # definign path for docling.Document within folder
-    doc_path = folder_location + "/" + filename + ".json"
-    # read file
-    try:
-        with Path(doc_path).open("r", encoding="utf-8") as fp:
-            doc_dict = json.load(fp)
-        doc = DoclingDocument.model_validate(doc_dict)
-    except Exception as e:
-        logging.error("corrupt")
-        return None
-    # define chunker
-    if max_tokens is None:
-        chunker = HybridChunker(tokenizer=embed_model_id)
-    else:
-        chunker = HybridChunker(tokenizer=embed_model_id, max_tokens=max_tokens)
-    
-    # chunking
-    chunk_iter = chunker.chunk(doc)
-    chunks = list(chunk_iter)
-    # create chunks lsit with metadata info
-    paragraphs = []
-    for i,chunk in enumerate(chunks):
-        ser_txt = chunker.serialize(chunk=chunk)
-        paragraphs.append({'content':ser_txt,
-                            'metadata':{'filename':filename,
-                                        'page':chunk.meta.doc_items[0].prov[0].page_no}})
-    
+def _save_chunks(chunk_iter, folder_location, output_format='json'):
+    """ saves the chunks to folder_location as chunks.json or chunks.jsonl, returns the path"""
+    os.makedirs(folder_location, exist_ok=True)
+
+    if output_format == 'jsonl':
+        write_jsonl(chunk_iter, folder_location+ "/chunks.jsonl")
+        return folder_location+ "/chunks.jsonl"
+
     # save the chunks   
-    chunks_list = {'paragraphs':paragraphs}
+    chunks_list = {'paragraphs':list(chunk_iter)}
     with open(folder_location+ "/chunks.json", 'w') as file:
         json.dump(chunks_list, file)
 
     return folder_location+ "/chunks.json"
-    
+
+
+def _init_chunk_worker(embed_model_id, max_tokens):
+    """ creates the chunker of worker process, so tokenizer is loaded once per worker"""
+    try:
+        _get_chunker(embed_model_id, max_tokens)
+    except Exception as e:
+        logging.error(e)
+
+
+def _chunk_folder(folder_location, embed_model_id, max_tokens, output_format):
+    """
+    chunks the docling.Document of folder, with output_format None the chunks are returned
+    serialized as json lines (batch for consolidated file) else saved in folder and path returned.
+    Returns (result, number of chunks), result is None if document could not be chunked
+    """
+    try:
+        doc = _load_document(folder_location)
+        if doc is None:
+            return None, 0
+        chunker = _get_chunker(embed_model_id, max_tokens)
+        chunks = list(_iter_doc_chunks(doc, chunker, os.path.basename(folder_location)))
+        if output_format is None:
+            return "".join(json.dumps(chunk, ensure_ascii=False) + "\n" for chunk in chunks), len(chunks)
+        return _save_chunks(iter(chunks), folder_location, output_format), len(chunks)
+    except Exception as e:
+        logging.error(f"{folder_location}: {e}")
+        return None, 0
+
+
+def corpus_chunking(folder_list:list, embed_model_id, max_tokens=None, output_path:str=None,
+                    output_format='json', workers:int=1):
+    """
+    hybrid chunking of many documents (outputs of batch_processing), the chunker (tokenizer)
+    is created once per process for (embed_model_id, max_tokens) instead of once per document.
+    With workers > 1 the folders are chunked in a process pool, each worker creating its chunker
+    once at start.
+
+    Params
+    --------------------
+    - folder_list: list of folder locations where output for a file is saved (ex: folder_info
+                    returned by batch_processing), Ex: ["../folder1/filename1", ...]
+    - embed_model_id: model id from hugging face to be used for emebdding, check hybrid_chunking
+    - max_tokens: token limit for chunking, check hybrid_chunking
+    - output_path: if given all chunks are written to this one consolidated json lines file,
+                    else chunks are saved per document in its folder (check hybrid_chunking)
+    - output_format: 'json' or 'jsonl' for the chunks file per document, not used with output_path
+    - workers: number of processes chunking the documents in parallel
+
+    Returns
+    -------------
+    - chunk_files: list with location of chunks file for each folder (None if document is
+                corrupt), with output_path the list of output_path
+    - count: total number of chunks
+
+    """
+    folder_list = [str(folder).rstrip("/") for folder in folder_list]
+    consolidated = output_path is not None
+    args = (embed_model_id, max_tokens, None if consolidated else output_format)
+
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_chunk_worker,
+                                       initargs=(embed_model_id, max_tokens))
+        chunksize = max(1, min(32, len(folder_list)//(workers*4)))
+        results = executor.map(_chunk_folder, folder_list, *[[arg]*len(folder_list) for arg in args],
+                               chunksize=chunksize)
+    else:
+        executor = None
+        results = (_chunk_folder(folder, *args) for folder in folder_list)
+
+    chunk_files = []
+    count = 0
+    try:
+        if consolidated:
+            # each document arrives as one serialized batch of lines, written in input order
+            with open(output_path, 'w', encoding='utf-8') as file:
+                for folder, (lines, n) in zip(folder_list, results):
+                    if lines is None:
+                        logging.warning(f"could not chunk {folder}")
+                        continue
+                    file.write(lines)
+                    count += n
+            chunk_files = [output_path]
+        else:
+            for folder, (path, n) in zip(folder_list, results):
+                if path is None:
+                    logging.warning(f"could not chunk {folder}")
+                chunk_files.append(path)
+                count += n
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    logging.info(f"{count} chunks created from {len(folder_list)} documents")
+    return chunk_files, count
@@ -1,8 +1,361 @@
 from gliner import GLiNER
+import os
+import logging
+import re
+import json
+import hashlib
+import tempfile
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+import torch
+
+# process-wide cache of loaded NER models, keyed by model name
+_MODEL_CACHE = {}
+_MODEL_LOCK = threading.Lock()
+# same as GLiNER WhitespaceTokenSplitter, used if model does not expose its words splitter
+_WORD_PATTERN = re.compile(r'\w+(?:[-_]\w+)*|\S')
+
+
+def get_model(model="gliner_multi"):
+
+  """
+  Returns the pre-trained GLiNER model, the model is downloaded/loaded only once per process
+  and the same instance is returned on later calls.
+
+  Args:
+      model (str, optional): The name of the pre-trained NER model to use. Defaults to "gliner_multi".
+
+  Returns:
+      GLiNER: the loaded model
+  """
+
+  with _MODEL_LOCK:
+    if model not in _MODEL_CACHE:
+      _MODEL_CACHE[model] = GLiNER.from_pretrained(f"urchade/{model}")
+    return _MODEL_CACHE[model]
+
+
+def redact_spans(text, entities, template="[{label} removed]"):
+
+  """
+  Redacts the entity spans in text in one linear pass using the 'start'/'end' offsets returned
+  by GLiNER, only the tagged occurrences are replaced. Overlapping spans are merged, the merged
+  span keeps the label of the span starting first (longest one on ties).
+
+  Args:
+      text (str): paragraph in which entities were recognized.
+      entities (list of dict): entities with 'start', 'end' and 'label'.
+      template (str, optional): replacement of span, formatted with label. Defaults to "[{label} removed]".
+
+  Returns:
+      tuple: (redacted_text, offset_map) where offset_map is list of dict for each redacted span
+             {'start', 'end': span in redacted_text, 'source_start', 'source_end': span in text,
+             'label'}. Text between the spans is unchanged, so any position of redacted_text can
+             be traced back to text using the map.
+  """
+
+  # sort and merge overlapping spans
+  spans = []
+  for entity in sorted(entities, key=lambda e: (e["start"], -e["end"])):
+    if spans and entity["start"] < spans[-1][1]:
+      spans[-1][1] = max(spans[-1][1], entity["end"])
+    else:
+      spans.append([entity["start"], entity["end"], entity["label"]])
+
+  pieces = []
+  offset_map = []
+  cursor = 0
+  position = 0
+  for start, end, label in spans:
+    pieces.append(text[cursor:start])
+    position += start - cursor
+    replacement = template.format(label=label)
+    pieces.append(replacement)
+    offset_map.append({'start': position, 'end': position + len(replacement),
+                       'source_start': start, 'source_end': end, 'label': label})
+    position += len(replacement)
+    cursor = end
+  pieces.append(text[cursor:])
+  return "".join(pieces), offset_map
+
+
+def _windows(text, word_spans, max_words, overlap):
+  """
+  splits text into windows of max_words words where consecutive windows share overlap words,
+  returns list of (char offset of window in text, window text)
+  """
+  if len(word_spans) <= max_words:
+    return [(0, text)]
+  windows = []
+  step = max_words - overlap
+  for first in range(0, len(word_spans), step):
+    last = min(first + max_words, len(word_spans)) - 1
+    start, end = word_spans[first][0], word_spans[last][1]
+    windows.append((start, text[start:end]))
+    if last == len(word_spans) - 1:
+      break
+  return windows
+
+
+def _merge_window_entities(text, entities):
+  """
+  de-duplicates the entities found by overlapping windows, same span found twice keeps the
+  higher score and a span contained in other span with same label (entity cut at the window
+  border) is dropped
+  """
+  best = {}
+  for entity in entities:
+    key = (entity["start"], entity["end"], entity["label"])
+    if key not in best or entity["score"] > best[key]["score"]:
+      best[key] = entity
+  merged = []
+  # longest span first for same start, so contained spans come after the containing one
+  max_end = {}
+  for entity in sorted(best.values(), key=lambda e: (e["start"], -e["end"])):
+    if entity["end"] <= max_end.get(entity["label"], -1):
+      continue
+    max_end[entity["label"]] = entity["end"]
+    entity["text"] = text[entity["start"]:entity["end"]]
+    merged.append(entity)
+  return merged
+
+
+def _normalize(text):
+  """
+  collapses the whitespace of text, returns (normalized text, word starts in text, word starts
+  in normalized text) used to map the offsets in normalized text back to text
+  """
+  words = [match.span() for match in re.finditer(r'\S+', text)]
+  normalized = " ".join(text[start:end] for start, end in words)
+  norm_starts = []
+  position = 0
+  for start, end in words:
+    norm_starts.append(position)
+    position += end - start + 1
+  return normalized, [start for start, _ in words], norm_starts
+
+
+def _to_text_offset(position, word_starts, norm_starts):
+  """ maps the position in normalized text to position in text"""
+  w = bisect_right(norm_starts, position) - 1
+  return word_starts[w] + (position - norm_starts[w])
+
+
+class NERCache:
+
+  """
+  LRU memo of NER results keyed by hash of whitespace normalized text, entity labels, model and
+  threshold.
+  Entities are kept with offsets in normalized text and are mapped back to each paragraph, so
+  repeated paragraphs (headers, footers, boilerplate) are predicted only once. Can be persisted
+  to disk to be reused across runs.
+
+  Usage:
+      cache = NERCache(max_size=200000, path="../cache/ner_cache.json")
+      recognizer = EntityRecognizer(cache=cache)
+      ...
+      cache.save()
+  """
+
+  def __init__(self, max_size=100000, path=None):
+
+    """
+    Args:
+        max_size (int, optional): Maximum number of paragraphs kept, least recently used are evicted.
+        path (str, optional): json file to load the cache from and save it to. Defaults to None (in memory).
+    """
+    self.max_size = max_size
+    self.path = path
+    self.entries = OrderedDict()
+    if path is not None and os.path.isfile(path):
+      try:
+        with open(path) as file:
+          self.entries = OrderedDict(json.load(file))
+      except Exception as e:
+        logging.warning(f"ner cache corrupt, starting empty cache: {e}")
+
+
+  @staticmethod
+  def make_key(normalized_text, entity_list, model, threshold=0.5):
+    """ returns the key of normalized text for the entity labels, model and threshold"""
+    key = hashlib.sha256()
+    for part in [normalized_text, "\0".join(sorted(entity_list)), model, str(threshold)]:
+      key.update(part.encode('utf-8'))
+      key.update(b'\0')
+    return key.hexdigest()
+
+
+  def get(self, key):
+    """ returns the cached entities or None"""
+    entities = self.entries.get(key)
+    if entities is not None:
+      self.entries.move_to_end(key)
+    return entities
+
+
+  def put(self, key, entities):
+    """ adds the entities for key, evicts least recently used entries above max_size"""
+    self.entries[key] = entities
+    self.entries.move_to_end(key)
+    while len(self.entries) > self.max_size:
+      self.entries.popitem(last=False)
+
+
+  def save(self):
+    """ save the cache to path"""
+    if self.path is None:
+      return
+    # unique tmp file, concurrent saves to same path do not write into each other
+    with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(self.path) or ".", suffix=".tmp",
+                                     delete=False) as file:
+      json.dump(list(self.entries.items()), file)
+    os.replace(file.name, self.path)
+
+
+class EntityRecognizer:
+
+  """
+  Reusable entity recognizer, the model is loaded once (shared by all recognizers of the process
+  using same model) and the paragraphs are predicted in batches.
+
+  Usage:
+      recognizer = EntityRecognizer(entity_list=["person", "e-mail"], batch_size=16, threads=8)
+      entities = recognizer.predict(list_of_para)
+      anonymized_paras = recognizer.anonymize(list_of_para)
+  """
+
+  def __init__(self, entity_list=["person", "phone number", "e-mail", "address"], model="gliner_multi",
+               batch_size=8, threads=None, threshold=0.5, max_words=None, window_overlap=50, cache=None):
+
+    """
+    Args:
+        entity_list (list of str, optional): A list of entity types to recognize.
+        model (str, optional): The name of the pre-trained NER model to use. Defaults to "gliner_multi".
+        batch_size (int, optional): Number of paragraphs predicted in one forward pass. Defaults to 8.
+        threads (int, optional): Number of threads used by torch for inference on CPU, this is
+            process wide setting. Defaults to None (torch default).
+        threshold (float, optional): Confidence threshold for predictions. Defaults to 0.5.
+        max_words (int, optional): Paragraphs longer than max_words words are split into overlapping
+            windows instead of being truncated by the model. Defaults to None (max_len of model).
+        window_overlap (int, optional): Number of words shared by consecutive windows. Defaults to 50.
+        cache (NERCache, optional): memo of results shared across calls/runs. Defaults to None, in that
+            case the duplicate paragraphs are still predicted only once per call.
+    """
+    self.entity_list = entity_list
+    self.model_name = model
+    self.cache = cache
+    self.batch_size = batch_size
+    self.threshold = threshold
+    if threads is not None:
+      torch.set_num_threads(threads)
+    self.model = get_model(model)
+    self.max_words = max_words or getattr(getattr(self.model, "config", None), "max_len", 384)
+    self.window_overlap = min(window_overlap, self.max_words // 2)
+    self.words_splitter = getattr(getattr(self.model, "data_processor", None), "words_splitter", None)
+
+
+  def _word_spans(self, text):
+    """ returns (start, end) of the words of text as split by the model"""
+    if self.words_splitter is not None:
+      return [(start, end) for _, start, end in self.words_splitter(text)]
+    return [match.span() for match in _WORD_PATTERN.finditer(text)]
+
+
+  def predict(self, list_of_para):
+
+    """
+    Recognizes the entities in list of paragraphs. Paragraphs are whitespace normalized and each
+    unique paragraph (not found in cache) is predicted once. Long paragraphs are split into
+    overlapping windows, windows of all paragraphs are predicted together in batches and the
+    entities found in overlapping regions are de-duplicated.
+
+    Returns:
+        list: list of recognized entities (list of dict with 'start', 'end', 'text', 'label', 'score')
+              for each paragraph, in same order as list_of_para
+    """
+    normalized = [_normalize(para) for para in list_of_para]
+    keys = [NERCache.make_key(norm[0], self.entity_list, self.model_name, self.threshold) for norm in normalized]
+
+    # unique paragraphs missing in cache
+    results = {}
+    missing = {}
+    for key, norm in zip(keys, normalized):
+      if key in results or key in missing:
+        continue
+      cached = self.cache.get(key) if self.cache is not None else None
+      if cached is not None:
+        results[key] = cached
+      else:
+        missing[key] = norm[0]
+    if missing:
+      for key, entities in zip(missing, self._predict(list(missing.values()))):
+        results[key] = [{k: v for k, v in entity.items() if k != "text"} for entity in entities]
+        if self.cache is not None:
+          self.cache.put(key, results[key])
+
+    # map the offsets in normalized text back to each paragraph
+    entities = []
+    for para, key, (_, word_starts, norm_starts) in zip(list_of_para, keys, normalized):
+      para_entities = []
+      for entity in results[key]:
+        start = _to_text_offset(entity["start"], word_starts, norm_starts)
+        end = _to_text_offset(entity["end"] - 1, word_starts, norm_starts) + 1
+        para_entities.append({**entity, "start": start, "end": end, "text": para[start:end]})
+      entities.append(para_entities)
+    return entities
+
+
+  def _predict(self, list_of_para):
+
+    """ predicts the entities of list of paragraphs using sliding windows, see predict"""
+    # (paragraph index, char offset of window, window text)
+    windows = []
+    split_paras = []
+    for i, para in enumerate(list_of_para):
+      para_windows = _windows(para, self._word_spans(para), self.max_words, self.window_overlap)
+      if len(para_windows) > 1:
+        split_paras.append(i)
+      windows.extend((i, offset, window) for offset, window in para_windows)
+
+    entities = [[] for _ in list_of_para]
+    for b in range(0, len(windows), self.batch_size):
+      batch = windows[b:b + self.batch_size]
+      predictions = self.model.batch_predict_entities([window for _, _, window in batch], self.entity_list,
+                                                      threshold=self.threshold)
+      for (i, offset, _), window_entities in zip(batch, predictions):
+        for entity in window_entities:
+          entity["start"] += offset
+          entity["end"] += offset
+        entities[i].extend(window_entities)
+
+    for i in split_paras:
+      entities[i] = _merge_window_entities(list_of_para[i], entities[i])
+    return entities
+
+
+  def anonymize(self, list_of_para, return_offsets=False):
+
+    """
+    Anonymizes the recognized entities in list of paragraphs, see redact_spans.
+
+    Args:
+        return_offsets (bool, optional): If True the offset map of each paragraph is returned too.
+
+    Returns:
+        list: list of paragraphs with the recognized entities anonymized, in same order as list_of_para.
+              If return_offsets is True, list of (anonymized paragraph, offset_map)
+    """
+    redacted = [redact_spans(para, entities) for para, entities in zip(list_of_para, self.predict(list_of_para))]
+    if return_offsets:
+      return redacted
+    return [para for para, _ in redacted]
+
 
 # Entity recognition
 
-def entity_recognizer(list_of_para, entity_list=["person", "phone number", "e-mail", "address"], anonymize=True, model="gliner_multi"): 
+def entity_recognizer(list_of_para, entity_list=["person", "phone number", "e-mail", "address"], anonymize=True, model="gliner_multi",
+                      batch_size=8, threads=None, cache=None):
 
   """
   Recognizes and optionally anonymizes specified entities in a list of paragraphs.
@@ -12,42 +365,25 @@ def entity_recognizer(list_of_para, entity_list=["person", "phone number", "e-ma
       entity_list (list of str, optional): A list of entity types to recognize. Defaults to ["person", "phone number", "e-mail", "address"].
       anonymize (bool, optional): If True, the recognized entities in the paragraphs will be anonymized. Defaults to True.
       model (str, optional): The name of the pre-trained NER model to use. Defaults to "gliner_multi".
+      batch_size (int, optional): Number of paragraphs predicted in one forward pass. Defaults to 8.
+      threads (int, optional): Number of threads used by torch for inference on CPU. Defaults to None.
+      cache (NERCache, optional): memo of results to reuse across calls/runs. Defaults to None.
 
     Returns:
         list or dict: If anonymize is False, returns a dictionary with paragraphs as keys and lists of recognized entities as values.
-                      If anonymize is True, returns a list of paragraphs with the recognized entities anonymized.
-  """
-  
-  # Download NER model
-  NER_model = GLiNER.from_pretrained(f"urchade/{model}")
-  
-  # Initialise an empty dictionary 
-  entities_per_text = {}
-
-  #Predict entities
-  for para in list_of_para: 
-    entities = NER_model.predict_entities(para, entity_list)
-    entities_per_text[para] = entities
-  
+                      If anonymize is True, returns a list of paragraphs with the recognized entities anonymized,
+                      in same order as list_of_para.
+  """
+
+  # model is loaded once per process and reused by later calls
+  recognizer = EntityRecognizer(entity_list=entity_list, model=model, batch_size=batch_size, threads=threads,
+                                cache=cache)
+
   # If only NER
-  if not anonymize: 
-    return entities_per_text
-  
+  if not anonymize:
+    unique_paras = list(dict.fromkeys(list_of_para))
+    return dict(zip(unique_paras, recognizer.predict(unique_paras)))
+
   # If anonymization
-  else: 
-    anonymized_paras = []
-
-    # for each paragraph
-    for key, value in entities_per_text.items(): 
-      
-      # iterate through each entity found
-      anonymized_para = key
-      for entity in value: 
-         
-        text_to_anonymize = entity["text"]
-        label = entity["label"]
-        anonymized_para = anonymized_para.replace(text_to_anonymize, f"[{label} removed]")
-      
-      anonymized_paras.append(anonymized_para)
-    
-    return anonymized_paras
\ No newline at end of file
+  else:
+    return recognizer.anonymize(list_of_para)
@@ -2,11 +2,17 @@ import pymupdf
 import pymupdf4llm
 import os
 import logging
-from nlputils.utils import get_files, open_file
-from langchain.text_splitter import MarkdownTextSplitter
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from nlputils.utils import get_files, open_file, get_page_count
+from nlputils.splitter import TextSplitter, MARKDOWN_SEPARATORS, TEXT_SEPARATORS
 
-def create_markdown(filepath, folder_location, filename):
+def _markdown_cache_key(cache, filepath):
+    """ cache key for page-wise markdown of file"""
+    return cache.make_key(filepath, processor='pymupdf4llm',
+                          config={'page_chunks': True, 'version': getattr(pymupdf4llm, '__version__', '')})
+
+
+def create_markdown(filepath, folder_location, filename, cache=None, workers=1, shard_pages=50):
     """
     reads file from filepath and converts it to page-wise markdown
 
@@ -15,12 +21,46 @@ def create_markdown(filepath, folder_location, filename):
     - filepath: filepath to pdf/other supported file formats
     - folder_location: location where to save the output
     - filename: filename to be used to create the dir within folder_location
+    - cache: nlputils.cache.ResultCache, if passed and the file is already processed the 
+            page-wise markdown files are restored from cache instead of converting again
+    - workers: if more than 1 and file has more than shard_pages pages, the file is split in 
+            page ranges of shard_pages pages which are converted in parallel processes. The
+            page files are named by page index in original file so the output is same.
+            Sharding is opt-in, with default workers=1 the file is converted in one call
+    - shard_pages: number of pages in each page range, used only with workers > 1
 
     Returns
     ----------------
     - new_path: path to where all page-wise markdown files will be saved
     
     """
+    if cache is not None:
+        try:
+            key = _markdown_cache_key(cache, filepath)
+            new_path = cache.get(key, restore_to=folder_location + f"tmp/{filename}/markdown/")
+            if new_path is not None:
+                return new_path
+        except Exception as e:
+            logging.error(e)
+            cache = None
+
+    page_count = get_page_count(filepath) if workers > 1 else None
+    if page_count is not None and page_count > shard_pages:
+        new_path = folder_location + f"tmp/{filename}/markdown/"
+        try:
+            os.makedirs(new_path, exist_ok=True)
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                errors = _convert_page_ranges(executor, [(filepath, page_count, new_path)], shard_pages)
+        except Exception as e:
+            logging.error(e)
+            errors = {filepath: str(e)}
+        if errors:
+            logging.warning(f"file corrupt {filepath}")
+            return None
+        if cache is not None:
+            cache.put(key, new_path)
+        return new_path
+
     try:
         with pymupdf.open(filepath) as doc:
             # convert file to markdown text
@@ -46,7 +86,10 @@ def create_markdown(filepath, folder_location, filename):
                             file.write(page['text'])
             except Exception as e:
                 logging.error(e)
-            
+                return new_path
+
+        if cache is not None:
+            cache.put(key, new_path)
         return new_path
     except Exception as e:
         logging.error(e)
@@ -54,7 +97,162 @@ def create_markdown(filepath, folder_location, filename):
         return None
 
 
-def useOCR_create_text(filepath, tessdata, folder_location, filename, dpi=300):
+def _markdown_pages(filepath, pages, new_path, hdr_info=None):
+    """
+    converts the pages (list of page index) of file to markdown and saves each page as 
+    '{page index}.md' in new_path, runs in worker process. hdr_info is header info of whole file
+    (_identify_headers), without it pymupdf4llm scans all pages of file for headers.
+    Returns number of pages saved
+    """
+    with pymupdf.open(filepath) as doc:
+        md_text = pymupdf4llm.to_markdown(doc, pages=pages, page_chunks=True, hdr_info=hdr_info)
+    for id, page in zip(pages, md_text):
+        with open(new_path + f'{id}.md', 'w') as file:
+            file.write(page['text'])
+    return len(pages)
+
+
+def _identify_headers(filepath):
+    """
+    header info (font size to markdown header level) of whole file, computed once per file and
+    passed to the conversion of each page range so the headers are same as converting in one go
+    """
+    with pymupdf.open(filepath) as doc:
+        return pymupdf4llm.IdentifyHeaders(doc)
+
+
+def _convert_page_ranges(executor, jobs, pages_per_task)->dict:
+    """
+    converts the files in page ranges of 'pages_per_task' pages using executor, header info of
+    file is identified once (as a task) before its page ranges are submitted.
+
+    Params
+    --------------
+    - executor: ProcessPoolExecutor
+    - jobs: list of tuple (filepath, page_count, new_path)
+    - pages_per_task: maximum pages converted by a worker in one go
+
+    Returns
+    ----------------
+    - errors: dict of filepath: error message for files which failed
+    """
+    errors = {}
+    header_futures = {}
+    futures = {}
+    for filepath, page_count, new_path in jobs:
+        page_ranges = [list(range(start, min(start + pages_per_task, page_count)))
+                       for start in range(0, page_count, pages_per_task)]
+        if len(page_ranges) == 1:
+            # single range scans the headers only once anyway
+            futures[executor.submit(_markdown_pages, filepath, page_ranges[0], new_path)] = filepath
+        else:
+            header_futures[executor.submit(_identify_headers, filepath)] = (filepath, page_ranges, new_path)
+
+    while futures or header_futures:
+        done, _ = wait(set(futures) | set(header_futures), return_when=FIRST_COMPLETED)
+        for future in done:
+            if future in header_futures:
+                filepath, page_ranges, new_path = header_futures.pop(future)
+                try:
+                    hdr_info = future.result()
+                except Exception as e:
+                    logging.error(e)
+                    errors[filepath] = str(e)
+                    continue
+                for pages in page_ranges:
+                    futures[executor.submit(_markdown_pages, filepath, pages, new_path, hdr_info)] = filepath
+            else:
+                filepath = futures.pop(future)
+                try:
+                    future.result()
+                except Exception as e:
+                    logging.error(e)
+                    errors[filepath] = str(e)
+    return errors
+
+
+def create_markdown_batch(files:list, folder_location:str, workers:int=None, pages_per_task:int=50,
+                          cache=None)->list:
+    """
+    converts the files to page-wise markdown in parallel using process pool, large files
+    are split into page ranges of 'pages_per_task' pages which are converted by different workers.
+    The output layout is same as create_markdown i.e 'folder_location/tmp/{filename}/markdown/{page}.md'
+
+    Params
+    --------------
+    - files: list of filepaths to pdf/other supported file formats
+    - folder_location: location where to save the output
+    - workers: number of processes, default is number of cores
+    - pages_per_task: maximum pages converted by a worker in one go
+    - cache: nlputils.cache.ResultCache, files already in cache are restored instead of converting
+
+    Returns
+    ----------------
+    - status: list of dict for each file {'filepath', 'filename', 'path_to_docs', 
+            'status': 'success'|'cached'|'failed', 'error'}
+    """
+    status = {}
+    keys = {}
+    jobs = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for filepath in files:
+            filename = os.path.splitext(os.path.basename(filepath))[0]
+            new_path = folder_location + f"tmp/{filename}/markdown/"
+            status[filepath] = {'filepath': filepath, 'filename': filename, 'path_to_docs': new_path,
+                                'status': 'success', 'error': None}
+            if cache is not None:
+                try:
+                    keys[filepath] = _markdown_cache_key(cache, filepath)
+                    if cache.get(keys[filepath], restore_to=new_path) is not None:
+                        status[filepath]['status'] = 'cached'
+                        continue
+                except Exception as e:
+                    logging.error(e)
+            page_count = get_page_count(filepath)
+            if page_count is None:
+                status[filepath].update({'path_to_docs': None, 'status': 'failed', 
+                                         'error': 'file could not be opened'})
+                logging.warning(f"file corrupt {filepath}")
+                continue
+            os.makedirs(new_path, exist_ok=True)
+            jobs.append((filepath, page_count, new_path))
+
+        # split the files in page ranges
+        errors = _convert_page_ranges(executor, jobs, pages_per_task)
+        for filepath, error in errors.items():
+            status[filepath].update({'status': 'failed', 'error': error})
+
+    for filepath, file_status in status.items():
+        if file_status['status'] == 'success' and filepath in keys:
+            cache.put(keys[filepath], file_status['path_to_docs'])
+    return list(status.values())
+
+
+# document handle of OCR worker process, opened once per worker
+_ocr_doc = None
+
+def _init_ocr_worker(filepath):
+    global _ocr_doc
+    _ocr_doc = pymupdf.open(filepath)
+
+
+def _ocr_page(doc, id, tessdata, dpi, new_path, ocr_only_missing):
+    """ ocr the page and save page output as text, pages with text layer are not OCRed if ocr_only_missing"""
+    page = doc[id]
+    text = page.get_text() if ocr_only_missing else ""
+    if text.strip() == "":
+        full_tp = page.get_textpage_ocr(tessdata = tessdata, flags=0, dpi=dpi, full=True)
+        text = page.get_text(textpage=full_tp)
+    with open(new_path + f'{id}.txt', 'w') as file:
+        file.write(text)
+
+
+def _ocr_page_worker(id, tessdata, dpi, new_path, ocr_only_missing):
+    _ocr_page(_ocr_doc, id, tessdata, dpi, new_path, ocr_only_missing)
+
+
+def useOCR_create_text(filepath, tessdata, folder_location, filename, dpi=300, workers:int=1,
+                       ocr_only_missing:bool=True):
     """
     reads file from filepath and converts it to page-wise text_file using OCR
 
@@ -64,45 +262,183 @@ def useOCR_create_text(filepath, tessdata, folder_location, filename, dpi=300):
     - folder_location: location where to save the output
     - filename: filename to be used to create the dir within folder_location
     - dpi: highher the dpi value better the resolution for text extraction
+    - workers: number of processes to OCR the pages in parallel, each worker has its own document
+            handle and at most 2*workers pages are in flight. None means number of cores
+    - ocr_only_missing: if True only pages without text layer are OCRed, for other pages the 
+            text layer is used
 
     Returns
     ----------------
-    - new_path: path to where all page-wise markdown files will be saved
+    - new_path: path to where all page-wise text files will be saved
 
     """
-    
+    workers = workers or os.cpu_count()
     try:
-        doc = pymupdf.open(filepath)
-        try:
-            if not os.path.exists(folder_location + f"tmp/{filename}/txt/"):
-                os.makedirs(folder_location + f"tmp/{filename}/txt/")
+        with pymupdf.open(filepath) as doc:
+            page_count = len(doc)
+            try:
                 new_path = folder_location + f"tmp/{filename}/txt/"
-            else:
-                new_path = folder_location + f"tmp/{filename}/markdown/"
-        except Exception as e:
-            logging.error(e)
-            return None
+                os.makedirs(new_path, exist_ok=True)
+            except Exception as e:
+                logging.error(e)
+                return None
 
+            # iterate through pages
+            if workers == 1:
+                for id in range(page_count):
+                    try:
+                        _ocr_page(doc, id, tessdata, dpi, new_path, ocr_only_missing)
+                    except Exception as e:
+                        logging.error(e)
+                return new_path
 
-        # iterate through pages
-        try:
-            for id,page in enumerate(doc):
-                # ocr the page and save page output as markdown
-                full_tp = page.get_textpage_ocr(tessdata = tessdata, flags=0, dpi=dpi, full=True)
-                
-                with open(new_path + f'{id}.txt', 'w') as file:
-                        file.write(page.get_text(textpage=full_tp))
-        except Exception as e:
-            logging.error(e)       
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_ocr_worker,
+                                 initargs=(filepath,)) as executor:
+            in_flight = set()
+            done = set()
+            for id in range(page_count):
+                # bounded queue of pages in flight keeps the memory flat
+                if len(in_flight) >= 2*workers:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    done |= finished
+                in_flight.add(executor.submit(_ocr_page_worker, id, tessdata, dpi, new_path,
+                                              ocr_only_missing))
+            finished, _ = wait(in_flight)
+            done |= finished
+        for future in done:
+            if future.exception() is not None:
+                logging.error(future.exception())
         return new_path
     except Exception as e:
         logging.error(e)
         logging.warning(f"file corrupt {filepath}")
         return None
 
+def _get_splitter(file_extension, chunk_size, overlap):
+    """ returns the splitter type based on file_extension"""
+    separators = MARKDOWN_SEPARATORS if file_extension == 'md' else TEXT_SEPARATORS
+    return TextSplitter(chunk_size=chunk_size, chunk_overlap=overlap, separators=separators)
+
+
+def _page_to_chunks(text, page, filename, splitter=None):
+    """ returns the chunks of page text, page is page index (starting 0). If splitter is None
+    the whole page is returned as one chunk"""
+    page_chunks = [text] if splitter is None else splitter.split_text(text)
+    return [{'content':chunk,
+             'metadata':{'page':page + 1,
+                         'filename':filename}} for chunk in page_chunks]
+
+
+def markdown_to_chunks(filepath, filename=None, overlap=10, chunk_size=800, page_level_chunk=False,
+                       pages_per_step=10, folder_location=None):
+    """
+    converts the file to markdown and creates chunks in memory without the round-trip of 
+    page-wise markdown files. This is generator, pages are converted 'pages_per_step' at a time
+    and chunks are yielded as soon as their page is converted.
+
+    Params
+    -----------------
+    - filepath: filepath to pdf/other supported file formats
+    - filename: filename used in metadata of chunks, default is name of file
+    - overlap: overlap size, this value is character based
+    - chunk_size: size of each para chunk to be created, this value is character based
+    - page_level_chunk: if True each page is one chunk
+    - pages_per_step: number of pages converted to markdown in one go
+    - folder_location: if passed, page-wise markdown is also saved in 
+                'folder_location/tmp/{filename}/markdown/' same as create_markdown
+
+    Returns
+    -------------
+    - generator of chunks where each chunk is dictionary {'content':actual content,
+    'metadata': dictionary with info on page and filename}
+
+    Usage
+    -------------
+        for chunk in markdown_to_chunks(filepath):
+            ...
+        paragraphs = list(markdown_to_chunks(filepath))
+
+    """
+    if filename is None:
+        filename = os.path.splitext(os.path.basename(filepath))[0]
+    splitter = None if page_level_chunk else _get_splitter('md', chunk_size, overlap)
+
+    new_path = None
+    if folder_location is not None:
+        try:
+            new_path = folder_location + f"tmp/{filename}/markdown/"
+            os.makedirs(new_path, exist_ok=True)
+        except Exception as e:
+            logging.error(e)
+            return
+
+    try:
+        doc = pymupdf.open(filepath)
+    except Exception as e:
+        logging.error(e)
+        logging.warning(f"file corrupt {filepath}")
+        return
+
+    with doc:
+        # headers are identified once for whole file, not for every step
+        try:
+            hdr_info = pymupdf4llm.IdentifyHeaders(doc)
+        except Exception as e:
+            logging.error(e)
+            logging.warning(f"file corrupt {filepath}")
+            return
+        for start in range(0, len(doc), pages_per_step):
+            pages = list(range(start, min(start + pages_per_step, len(doc))))
+            try:
+                md_text = pymupdf4llm.to_markdown(doc, pages=pages, page_chunks=True, hdr_info=hdr_info)
+            except Exception as e:
+                logging.error(e)
+                logging.warning(f"pages {pages[0]}-{pages[-1]} could not be converted {filepath}")
+                continue
+            for id, page in zip(pages, md_text):
+                if new_path is not None:
+                    with open(new_path + f'{id}.md', 'w') as file:
+                        file.write(page['text'])
+                yield from _page_to_chunks(page['text'], id, filename, splitter)
+
+
+def iter_chunks(folder_location, filename, overlap=10, chunk_size=800, file_extension = 'md', page_level_chunk = False):
+    """
+    generator version of create_chunks, pages are read and split one at a time and chunks are
+    yielded lazily. Use with nlputils.utils.write_jsonl to stream the chunks to disk.
+
+    Params
+    -----------------
+    same as create_chunks
+
+    Returns
+    -------------
+    - generator of chunks where each chunk is dictionary {'content':actual content,
+    'metadata': dictionary with info on page and filename}
+
+    Usage
+    -------------
+        write_jsonl(iter_chunks(path_to_markdown, filename), "../output/chunks.jsonl")
+
+    """
+    pages = get_files(folder_location,file_extensions=[file_extension])
+    pages = pages[file_extension]
+    # sort the pages, page index is the name of file
+    pages.sort(key=lambda f: int(os.path.splitext(os.path.basename(f))[0]))
+
+    splitter = None if page_level_chunk else _get_splitter(file_extension, chunk_size, overlap)
+    # iterate through the pages
+    for page in pages:
+        with open(page, 'r') as f:
+            text = f.read()
+        yield from _page_to_chunks(text, int(os.path.splitext(os.path.basename(page))[0]),
+                                   filename, splitter)
+
+
 def create_chunks(folder_location, filename, overlap=10, chunk_size=800, file_extension = 'md', page_level_chunk = False):
     """
-    read the files in folder-location and create_chunks using splitters from langchain
+    read the files in folder-location and create_chunks using nlputils.splitter.TextSplitter. For 
+    very large documents use iter_chunks to avoid holding all chunks in memory
 
     Params
     -----------------
@@ -118,44 +454,6 @@ def create_chunks(folder_location, filename, overlap=10, chunk_size=800, file_ex
     'metadata': dictionary with info on page and filename}
 
     """
-    chunks_placeholder = []
-     
-    pages = get_files(folder_location,file_extensions=[file_extension])
-    pages = pages[file_extension]
-    # sort the pages
-    pages.sort(key=lambda f: int(''.join(filter(str.isdigit, f))))
-
-    if page_level_chunk == True:
-        for page in pages:
-            with open(page, 'r') as f:
-                chunk = f.read()
-            chunks_placeholder.append({'content':chunk, 
-                                'metadata':{'page':int(os.path.splitext(os.path.basename(page))[0]) + 1,
-                                'filename':filename}})
-
-        return {'paragraphs':chunks_placeholder}
-    else:
-        # define the splitter type based on file_extension
-        if file_extension == 'md':
-            splitter = MarkdownTextSplitter(chunk_size=chunk_size, chunk_overlap=overlap)
-        else:
-            splitter = RecursiveCharacterTextSplitter(
-                    chunk_size=chunk_size,
-                    chunk_overlap=overlap,
-                    length_function=len,
-                    is_separator_regex=False,
-                )
-        # iterate through the pages
-        for page in pages:
-            with open(page, 'r') as f:
-                markdown_string = f.read()
-            page_chunks = splitter.split_text(markdown_string)
-            # iterate through page_chunks
-            for j,chunk in enumerate(page_chunks):
-                chunks_placeholder.append({'content':chunk,
-                                        'metadata':{'page':int(os.path.splitext(os.path.basename(page))[0]) +1,
-                                                    'filename':filename}})    
-        return {'paragraphs':chunks_placeholder}
-
-
-
+    chunks_placeholder = list(iter_chunks(folder_location, filename, overlap=overlap, chunk_size=chunk_size,
+                                          file_extension=file_extension, page_level_chunk=page_level_chunk))
+    return {'paragraphs':chunks_placeholder}
@@ -0,0 +1,148 @@
+import re
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+
+# separator hierarchy used for markdown, langchain MarkdownTextSplitter escapes its heading
+# and horizontal line patterns (ex: "\n#{1,6} ") and matches them literally, so they never
+# split real text, only the effective separators are kept here to give the same chunks
+MARKDOWN_SEPARATORS = ["```\n", "\n\n", "\n", " ", ""]
+TEXT_SEPARATORS = ["\n\n", "\n", " ", ""]
+
+
+class _Offsets(dict):
+    """ separator -> sorted positions of all (including overlapping) occurrences in text"""
+
+    def __init__(self, text):
+        super().__init__()
+        self.text = text
+
+    def __missing__(self, separator):
+        if len(separator) == 1:
+            # positions from the lengths of parts, str.split and accumulate run in C
+            parts = self.text.split(separator)
+            positions = list(accumulate(map((1).__add__, map(len, parts[:-1])), initial=-1))[1:]
+        else:
+            positions = [match.start() for match in re.finditer(f"(?={re.escape(separator)})", self.text)]
+        self[separator] = positions
+        return positions
+
+
+def _boundaries(offsets, separator, start, end):
+    """
+    returns the boundaries of pieces when span is split at non-overlapping occurrences of
+    separator, separator is kept at the start of piece and empty pieces are dropped.
+    Piece k is [boundaries[k], boundaries[k+1])
+    """
+    if separator == "":
+        return list(range(start, end + 1))
+    positions = offsets[separator]
+    i = bisect_left(positions, start)
+    j = bisect_left(positions, end - len(separator) + 1)
+    if len(separator) == 1:
+        boundaries = positions[i:j]
+    else:
+        # skip occurrences overlapping with previous match (same as re.split)
+        boundaries = []
+        last_end = start
+        for position in positions[i:j]:
+            if position >= last_end:
+                boundaries.append(position)
+                last_end = position + len(separator)
+    if not boundaries or boundaries[0] != start:
+        boundaries.insert(0, start)
+    boundaries.append(end)
+    return boundaries
+
+
+def _add_chunk(chunks, chunk):
+    """ adds the stripped chunk if it is not empty"""
+    chunk = chunk.strip()
+    if chunk != "":
+        chunks.append(chunk)
+
+
+class TextSplitter:
+    """
+    recursive character splitter with same output as langchain RecursiveCharacterTextSplitter/
+    MarkdownTextSplitter (keep_separator=True, strip_whitespace=True, length_function=len).
+    Separators are matched literally. The occurrences of each separator are found once for
+    the text and the splitting/merging works on the piece boundaries (offsets), chunk ends
+    and overlaps are found by binary search instead of adding the pieces one by one.
+
+    Usage
+    -------------
+        splitter = TextSplitter(chunk_size=800, chunk_overlap=10, separators=MARKDOWN_SEPARATORS)
+        chunks = splitter.split_text(markdown_string)
+
+    """
+
+    def __init__(self, chunk_size:int=800, chunk_overlap:int=10, separators:list=None):
+        """
+        Params
+        -------------
+        - chunk_size: size of each chunk, this value is character based
+        - chunk_overlap: overlap size, this value is character based
+        - separators: separators in order of preference, default is TEXT_SEPARATORS
+        """
+        if chunk_overlap > chunk_size:
+            raise ValueError(f"Got a larger chunk overlap ({chunk_overlap}) than chunk size "
+                             f"({chunk_size}), should be smaller.")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = separators or TEXT_SEPARATORS
+
+
+    def split_text(self, text:str)->list:
+        """ returns the list of chunks of text"""
+        # occurrences of separator in text are found once, when separator is needed first
+        offsets = _Offsets(text)
+        return self._split(text, offsets, 0, len(text), self.separators)
+
+
+    def _split(self, text, offsets, start, end, separators):
+        """ returns the chunks of text[start:end]"""
+        # first separator found in the span is used, rest are used for too long pieces
+        separator, new_separators = "", []
+        for i, sep in enumerate(separators):
+            if sep == "":
+                break
+            positions = offsets[sep]
+            k = bisect_left(positions, start)
+            if k < len(positions) and positions[k] + len(sep) <= end:
+                separator, new_separators = sep, separators[i + 1:]
+                break
+
+        boundaries = _boundaries(offsets, separator, start, end)
+        chunk_size = self.chunk_size
+        too_long = [k for k, (a, b) in enumerate(zip(boundaries, boundaries[1:])) if b - a >= chunk_size]
+
+        # pieces shorter than chunk_size are merged, longer ones are split with next separators
+        chunks = []
+        first = 0
+        for k in too_long:
+            if k > first:
+                chunks.extend(self._merge(text, boundaries, first, k))
+            if not new_separators:
+                chunks.append(text[boundaries[k]:boundaries[k + 1]])
+            else:
+                chunks.extend(self._split(text, offsets, boundaries[k], boundaries[k + 1], new_separators))
+            first = k + 1
+        if first < len(boundaries) - 1:
+            chunks.extend(self._merge(text, boundaries, first, len(boundaries) - 1))
+        return chunks
+
+
+    def _merge(self, text, boundaries, first, last):
+        """ merges the contiguous pieces first..last-1 into chunks of chunk_size with chunk_overlap"""
+        chunks = []
+        while True:
+            # first boundary beyond chunk_size, the piece ending there starts next chunk
+            k = bisect_right(boundaries, boundaries[first] + self.chunk_size, first, last + 1)
+            if k > last:
+                break
+            _add_chunk(chunks, text[boundaries[first]:boundaries[k - 1]])
+            # keep the tail of chunk as overlap, the overlap and next piece must fit in chunk_size
+            first = bisect_left(boundaries, max(boundaries[k - 1] - self.chunk_overlap,
+                                                boundaries[k] - self.chunk_size), first, k - 1)
+        _add_chunk(chunks, text[boundaries[first]:boundaries[last]])
+        return chunks
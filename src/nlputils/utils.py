@@ -8,20 +8,63 @@ import json
 import os
 from tqdm import tqdm
 import re
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 
-def check_if_imagepdf(file_path:str)->bool | None:  
+def _sample_pages(page_count:int, sample:int=None)->list:
+    """ returns page indices to be checked, 'sample' evenly spaced pages including first and last"""
+    if sample is None or sample >= page_count:
+        return list(range(page_count))
+    if sample <= 1:
+        return [0]
+    return sorted({round(i*(page_count-1)/(sample-1)) for i in range(sample)})
+
+
+def _page_has_text(page)->bool:
+    """ check if page has text layer with real text (not just whitespace)"""
+    return page.get_text().strip() != ""
+
+
+def check_if_imagepdf(file_path:str, sample:int=None)->bool | None:  
     """
     check for if the file is normal pdf or scanned/image pdf
-    will return either True/False or None if some error occurs in opening file
+    will return either True/False or None if some error occurs in opening file.
+    The check stops at first page with text.
+
+    Params
+    ----------
+    - file_path: path to pdf file
+    - sample: number of evenly spaced pages to be checked, None means all pages
     """
-    text = ""
     try:
-        doc = fitz.open(file_path)
-        for page in doc:
-            text += page.get_text()
-        if text == "":
+        with fitz.open(file_path) as doc:
+            for i in _sample_pages(len(doc), sample):
+                if _page_has_text(doc[i]):
+                    return False
             return True
-        else:return False
+    except Exception as e:
+        logging.error(e)
+        logging.warning(f"Error caused by File:{file_path}")
+        return None
+
+
+def get_ocr_pages(file_path:str, sample:int=None)->list | None:
+    """
+    returns per-page "needs OCR" bitmap for pdf, i.e list with value for each page True if page
+    has no text layer, False if it has text. Pages not checked (when sampling) have value None.
+    Returns None if some error occurs in opening file.
+
+    Params
+    ----------
+    - file_path: path to pdf file
+    - sample: number of evenly spaced pages to be checked, None means all pages
+    """
+    try:
+        with fitz.open(file_path) as doc:
+            ocr_pages = [None]*len(doc)
+            for i in _sample_pages(len(doc), sample):
+                ocr_pages[i] = not _page_has_text(doc[i])
+            return ocr_pages
     except Exception as e:
         logging.error(e)
         logging.warning(f"Error caused by File:{file_path}")
@@ -31,13 +74,22 @@ def check_if_imagepdf(file_path:str)->bool | None:
 def get_page_count(file_path:str)->int | None:
     """ returns the count of page in file (only pdf,docx)"""
     try:
-        doc = fitz.open(file_path)
-        return len(doc)
+        with fitz.open(file_path) as doc:
+            return len(doc)
     except Exception as e:
         logging.error(e)
         return None
 
 
+def file_sha256(file_path:str, block_size:int=1 << 20)->str:
+    """ returns the sha256 hex digest of file content, file is read in blocks"""
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
 def get_files(root_folder:str,file_extensions=['pdf','docx'], recursive=True)->dict | None:
     """returns the files with extension provided in the root folder, 
         use recursive flag to do search recursively or not
@@ -68,6 +120,79 @@ def get_files(root_folder:str,file_extensions=['pdf','docx'], recursive=True)->d
         return
 
 
+def _scan_file(file_path:str, sample:int=None)->dict:
+    """
+    collects the manifest info for single file, opens the file only once. Only pdf is opened
+    with fitz, other files (ex: docx) get size and sha256 with page info as None and no error
+    """
+    info = {'file_path': file_path, 'filename': os.path.basename(file_path),
+            'extension': os.path.splitext(file_path)[1].lstrip('.').lower(),
+            'size': None, 'sha256': None, 'page_count': None, 'scanned_page_ratio': None,
+            'encrypted': None, 'error': None}
+    try:
+        info['size'] = os.path.getsize(file_path)
+        info['sha256'] = file_sha256(file_path)
+        if info['extension'] != 'pdf':
+            return info
+        with fitz.open(file_path) as doc:
+            info['encrypted'] = bool(doc.needs_pass or doc.is_encrypted)
+            info['page_count'] = len(doc)
+            if not doc.needs_pass:
+                pages = _sample_pages(len(doc), sample)
+                if pages:
+                    scanned = sum(not _page_has_text(doc[i]) for i in pages)
+                    info['scanned_page_ratio'] = scanned/len(pages)
+    except Exception as e:
+        info['error'] = str(e)
+    return info
+
+
+def scan_corpus(root_folder:str, manifest_path:str = None, file_extensions=['pdf','docx'],
+                recursive=True, workers:int=None, sample:int=None)->pd.DataFrame:
+    """
+    pre-flight scan of all the files in root_folder (uses get_files), each file is opened 
+    exactly once in a process pool and the info is saved as columnar manifest (parquet)
+
+    Params
+    ----------
+    - root_folder: root directory on which the file search will be carried out
+    - manifest_path: filepath of parquet manifest, default is "root_folder/manifest.parquet"
+    - file_extensions: file-extensions which will be considered in root dir
+    - recursive: to search recursively in sub-dir or not, defualt =True
+    - workers: number of processes, default is number of cores
+    - sample: number of evenly spaced pages to check for scanned page ratio, None means all
+
+    Return
+    --------
+    manifest: dataframe with columns [file_path, filename, extension, size, sha256, page_count,
+            scanned_page_ratio, encrypted, error], error is None if file could be opened. Page
+            info is collected only for pdf files
+    """
+    files = get_files(root_folder, file_extensions=file_extensions, recursive=recursive)
+    files = [f for file_list in files.values() for f in file_list]
+    if manifest_path is None:
+        manifest_path = os.path.join(root_folder, 'manifest.parquet')
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, len(files)//((workers or os.cpu_count() or 1)*4))
+        rows = list(tqdm(executor.map(_scan_file, files, [sample]*len(files), chunksize=chunksize),
+                         total=len(files)))
+
+    manifest = pd.DataFrame(rows, columns=['file_path', 'filename', 'extension', 'size', 'sha256',
+                                           'page_count', 'scanned_page_ratio', 'encrypted', 'error'])
+    manifest['page_count'] = manifest['page_count'].astype('Int64')
+    manifest.to_parquet(manifest_path, index=False)
+    logging.info(f"scanned {len(manifest)} files, {manifest.error.notna().sum()} could not be opened")
+    return manifest
+
+
+def load_manifest(manifest)->pd.DataFrame:
+    """ returns the manifest created by scan_corpus, manifest can be parquet filepath or dataframe"""
+    if isinstance(manifest, pd.DataFrame):
+        return manifest
+    return pd.read_parquet(manifest)
+
+
 def convertfile(docx_path, pdf_path):
     """
     convert docx file to pdf and save it to 'pdf_path'
@@ -111,6 +236,87 @@ def open_file(filepath):
     return simple_json
 
 
+def write_jsonl(items, file_path:str, append:bool=False, flush_every:int=1000)->int:
+    """
+    writes the items (iterable of dict, ex: chunks generator) to file as json lines. Items are
+    consumed lazily so the memory stays bounded irrespective of number of items.
+
+    Params
+    -----------
+    - items: iterable of json serializable objects
+    - file_path: path of .jsonl file
+    - append: if True items are appended to existing file
+    - flush_every: file is flushed after every 'flush_every' items, so the downstream
+                reader can start before all items are written
+
+    Returns
+    -----------
+    - count: number of items written
+    """
+    count = 0
+    with open(file_path, 'a' if append else 'w', encoding='utf-8') as file:
+        for item in items:
+            file.write(json.dumps(item, ensure_ascii=False) + "\n")
+            count += 1
+            if count % flush_every == 0:
+                file.flush()
+    return count
+
+
+def read_jsonl(file_path:str):
+    """ generator of the items saved in json lines file"""
+    with open(file_path, encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_json_array(file_path:str, block_size:int=1 << 16):
+    """
+    generator of the items of json file with top level array (ex: axaparsr simple-json), the
+    file is read in blocks and each item is decoded as soon as it is complete, so only one
+    item is held in memory instead of whole document
+
+    Params
+    -----------
+    - file_path: path of json file
+    - block_size: number of characters read at once
+    """
+    decoder = json.JSONDecoder()
+    separators = re.compile(r'[\s,]*')
+    whitespace = re.compile(r'\s*')
+    with open(file_path, encoding='utf-8') as file:
+        buffer = file.read(block_size).lstrip()
+        while buffer == '':
+            block = file.read(block_size)
+            if block == '':
+                break
+            buffer = block.lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f"{file_path} is not a json array")
+        buffer, position, eof = buffer[1:], 0, False
+        while True:
+            position = separators.match(buffer, position).end()
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+                # item is complete only when followed by separator, a number at the end of
+                # buffer may continue in next block
+                end = whitespace.match(buffer, end).end()
+                if (end < len(buffer) and buffer[end] in ',]') or eof:
+                    yield item
+                    position = end
+                    continue
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            block = file.read(block_size)
+            eof = block == ''
+            buffer = buffer[position:] + block
+            position = 0
+
+
 def get_config(configfile_path:str)->object:
     """
     configfile_path: file path of .cfg file